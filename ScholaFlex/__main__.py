@@ -0,0 +1,5 @@
+import sys
+
+from .my_school import cli  # python -m ScholaFlex courses.txt students.txt results.txt, see cli for the options
+
+sys.exit(cli())
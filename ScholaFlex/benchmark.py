@@ -0,0 +1,177 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .my_school import ReportWriter, Results, load_results, np
+from .synthetic_data import add_mix_arguments, dataset_files, generate_dataset, mix_options
+
+DEFAULT_SIZES = [100000]  # result rows, 10**6 and 10**7 can be asked for with --sizes
+DENSE_CELL_LIMIT = 10 ** 7  # the dense results grid is only rendered when students x courses is below this
+PERCENTILE_QUERIES = 1000
+
+
+class Benchmark:  # runs the timed steps of one data set and keeps the best and every time of each step
+    def __init__(self, size, rows):
+        self.size = size
+        self.rows = rows  # the number of result rows, used for the rows/sec figures
+        self.times = {}  # step name -> every time it took, one per repeat
+        self.memory = {}  # memory step name -> bytes per student
+
+    def time(self, name, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        self.times.setdefault(name, []).append(time.perf_counter() - started)
+        return result
+
+    def measure(self, name, *files):
+        # loads the data set with tracemalloc on and keeps the bytes held per student once loading is done
+        tracemalloc.start()
+        try:
+            results = load_results(*files)
+            held = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.memory[name] = held / max(1, len(results.students))
+
+    def records(self):
+        return [{'size': self.size, 'benchmark': name, 'unit': 's', 'best': min(times), 'median': sorted(times)[len(times) // 2],
+                 'times': times, 'rows_per_sec': self.rows / min(times) if min(times) > 0 else None}
+                for name, times in self.times.items()] + \
+               [{'size': self.size, 'benchmark': name, 'unit': 'bytes/student', 'best': held, 'median': held, 'times': [held], 'rows_per_sec': None}
+                for name, held in self.memory.items()]
+
+
+def run_size(size, options, data_directory, repeats, workers):
+    # generates (or reuses) the data set for size result rows and runs every step repeats times
+    students = max(1, size // options['courses_per_student'])
+    data_name = f"{size}_" + '_'.join(f'{value}' for value in options.values())
+    directory = os.path.join(data_directory, data_name)
+    if os.path.exists(os.path.join(directory, 'done')):
+        courses_file, students_file, results_files = dataset_files(directory, options['shards'])
+    else:
+        courses_file, students_file, results_files = generate_dataset(directory, students, **options)
+        open(os.path.join(directory, 'done'), 'w').close()  # the files are complete and can be reused by the next run
+
+    benchmark = Benchmark(size, students * min(options['courses_per_student'], options['courses']))
+    rng = random.Random(0)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        # the memory held by the loaded students, with the score dictionaries and with Results(compact=True)
+        benchmark.measure('memory_per_student', courses_file, students_file, results_files, workers)
+        benchmark.measure('memory_per_student_compact', courses_file, students_file, results_files, workers, True)
+        if np is not None:  # the columnar store needs numpy
+            benchmark.measure('memory_per_student_columnar', courses_file, students_file, results_files, workers, False, True)
+        for repeat in range(repeats):
+            benchmark.time('load_compact', load_results, courses_file, students_file, results_files, workers, True)
+            if np is not None:
+                columnar = benchmark.time('load_columnar', load_results, courses_file, students_file, results_files, workers, False, True)
+                benchmark.time('compute_all_metrics_columnar', columnar.compute_all_metrics)
+                del columnar
+            results = benchmark.time('load', load_results, courses_file, students_file, results_files, workers)
+            benchmark.time('student_metrics_python', lambda: [student.student_metrics(results.courses) for student in results.students.values()])
+            for student in results.students.values():
+                student.metrics = None  # cold again for compute_all_metrics
+            benchmark.time('compute_all_metrics', results.compute_all_metrics)
+            benchmark.time('weighted_gpa_4_cached', lambda: [student.weighted_gpa_4(results.courses) for student in results.students.values()])
+            sample = rng.sample(list(results.students), min(PERCENTILE_QUERIES, len(results.students)))
+
+            def summary_queries():
+                for student_type in ('UG', 'PG'):
+                    results.top_students(10, student_type)
+                results.bottom_courses(10, 'core')
+                results.bottom_courses(10, 'elective')
+                for student_id in sample:
+                    results.percentile_rank(student_id)
+
+            benchmark.time('summary_queries', summary_queries)
+            for name, display, args in (('render_course_info', results.display_course_info, ()),
+                                        ('render_student_info', results.display_student_info, ()),
+                                        ('render_summaries', lambda writer: (results.display_course_summary(writer), results.display_student_summary(writer)), ()),
+                                        ('render_results_sparse', results.display_actual_results, (True,))):
+                writer = ReportWriter([devnull])
+                benchmark.time(name, lambda: (display(writer, *args), writer.flush()))
+            if len(results.students) * len(results.courses) <= DENSE_CELL_LIMIT:
+                writer = ReportWriter([devnull])
+                benchmark.time('render_results_dense', lambda: (results.display_actual_results(writer), writer.flush()))
+            snapshot_file = os.path.join(directory, 'results.snapshot')
+            benchmark.time('snapshot_save', results.save_snapshot, snapshot_file)
+            benchmark.time('snapshot_load', Results.load_snapshot, snapshot_file)
+    return benchmark.records()
+
+
+def run_settings(options, workers):
+    # what has to be the same for two runs to be compared: the data set options (mix, shards, seed) and the workers
+    return {**options, 'workers': workers}
+
+
+def compare(records, previous_file, threshold, settings):
+    # prints how every step did against an earlier run, returns the number of steps slower by more than threshold.
+    # settings is the run_settings of this run, an earlier run made with other settings timed other data (or another
+    # number of processes), so nothing is compared with it and None is returned
+    with open(previous_file) as file:
+        previous_run = json.load(file)
+    meta = previous_run.get('meta', {})
+    previous_settings = run_settings(meta.get('options', {}), meta.get('workers'))
+    differences = [f"{name} {previous_settings.get(name)} (now {value})" for name, value in settings.items() if previous_settings.get(name) != value]
+    if differences:
+        print(f"Not comparing with {previous_file}, it was run with {', '.join(differences)}.")
+        return None
+    previous = {(record['size'], record['benchmark']): record['best'] for record in previous_run['results']}
+    regressions = 0
+    print('Size'.ljust(10) + 'Benchmark'.ljust(26) + 'Before'.rjust(10) + 'Now'.rjust(10) + 'Ratio'.rjust(8))
+    for record in records:
+        before = previous.get((record['size'], record['benchmark']))
+        if before is None:
+            continue
+        ratio = record['best'] / before if before > 0 else 1
+        slower = ratio > 1 + threshold
+        regressions += slower
+        print(str(record['size']).ljust(10) + record['benchmark'].ljust(26) + f"{before:10.3f}{record['best']:10.3f}{ratio:8.2f}"
+              + ('  REGRESSION' if slower else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m ScholaFlex.benchmark', description='Times loading, metrics, summary queries and report rendering on synthetic data sets, and measures the memory a loaded student takes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='the result rows of every data set (default: 100000)')
+    parser.add_argument('--repeats', type=int, default=3, help='how many times every step is run, the best time is kept (default: 3)')
+    parser.add_argument('--workers', type=int, help='the processes used to read sharded results files')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'scholaflex-benchmark'), help='where the data sets are kept between runs')
+    parser.add_argument('--output', help='write the results as json to this file')
+    parser.add_argument('--compare', metavar='FILE', help='an earlier --output file to compare against, it must have been run with the same data set options and --workers')
+    parser.add_argument('--threshold', type=float, default=0.1, help='how much slower a step can get before it counts as a regression (default: 0.1)')
+    add_mix_arguments(parser)
+    arguments = parser.parse_args()
+
+    options = mix_options(arguments)
+    records = []
+    for size in arguments.sizes:
+        records.extend(run_size(size, options, arguments.data_dir, arguments.repeats, arguments.workers))
+    print('Size'.ljust(10) + 'Benchmark'.ljust(26) + 'Best'.rjust(10) + 'Rows/sec'.rjust(14))
+    for record in records:
+        if record['unit'] == 's':
+            figures = f"{record['best']:10.3f}{record['rows_per_sec'] or 0:14.0f}"
+        else:
+            figures = f"{record['best']:10.0f}" + record['unit'].rjust(14)
+        print(str(record['size']).ljust(10) + record['benchmark'].ljust(26) + figures)
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump({'meta': {'python': sys.version.split()[0], 'platform': platform.platform(),
+                                'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'options': options, 'workers': arguments.workers, 'repeats': arguments.repeats},
+                       'results': records}, file, indent=1)
+    if arguments.compare:
+        regressions = compare(records, arguments.compare, arguments.threshold, run_settings(options, arguments.workers))
+        if regressions is None:
+            return 2  # the runs cannot be compared
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
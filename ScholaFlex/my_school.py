@@ -1,4 +1,40 @@
+import argparse
+import contextlib
+import cProfile
+import csv
+import heapq
+import json
+import math
+import mmap
+import os
+import pstats
+import struct
+import sys
+import time
+import tracemalloc
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, chain, islice, repeat
+
+try:
+    import resource  # only there on Unix, it gives the peak RSS reported by --timings
+except ImportError:
+    resource = None
+
+try:
+    import numpy as np  # numpy is optional, it is only needed for the columnar score store (Results(columnar=True))
+except ImportError:
+    np = None
+
+
 class Course:  # This is the course class that has all the parameters to accommodate the Courses
+    average_hits = 0  # how many times average_score was answered from the cache, shared by every course
+    average_misses = 0
+    # slots instead of a __dict__ per course, setting any other attribute on a course is an AttributeError
+    __slots__ = ('id', 'name', 'credit', 'students_finished', 'students_ongoing', 'total_score', 'average')
+
     def __init__(self, id, name, credit):  # name and credits are the main parameters for course
         self.id = id  # The unique identifier for the course
         self.name = name  # The name of the course e.g. Java, etc.
@@ -6,60 +42,146 @@ class Course:  # This is the course class that has all the parameters to accommo
         self.students_finished = 0  # a counter for students who finished the course
         self.students_ongoing = 0  # a counter for students currently enrolled in the course
         self.total_score = 0  # This is the sum of all student scores in the course
+        self.average = None  # the cached average score, cleared whenever a score is added or removed
     
     def add_student_score(self, score):
+        self.average = None
         if score != '--':
             self.total_score += score  # As long as the score is not '--' the score is incremented 
             self.students_finished += 1  # Incrementing the counter of students who have finished the course
         else:
             self.students_ongoing += 1  # Incrementing the counter of students currently enrolled in the course
+
+    def remove_student_score(self, score):
+        # takes a score back out of the counters, used when a score is corrected or an enrollment is deleted
+        self.average = None
+        if score != '--':
+            self.total_score -= score
+            self.students_finished -= 1
+        else:
+            self.students_ongoing -= 1
+
+    def add_score_totals(self, total_score, students_finished, students_ongoing):
+        # adds the counters of many scores at once, this is how the results read by a worker process are merged
+        self.average = None
+        self.total_score += total_score
+        self.students_finished += students_finished
+        self.students_ongoing += students_ongoing
     
     def average_score(self):  # This is the calculation for the average score based on how many students finished the course versus how many didn't
         # The average is calculated by dividing the total score by the number of students who finished the course.
         # If no students have finished the course yet, the average score is 0
-        return self.total_score / self.students_finished if self.students_finished > 0 else 0
+        if self.average is not None:
+            Course.average_hits += 1
+            return self.average
+        Course.average_misses += 1
+        self.average = self.total_score / self.students_finished if self.students_finished > 0 else 0
+        return self.average
+
+    @staticmethod
+    def reset_average_counters():
+        Course.average_hits = 0
+        Course.average_misses = 0
 
 
 class CoreCourse(Course):  # This class is a placeholder for all of the Core Courses taken by a student, usually all
+    __slots__ = ('semester',)
+
     def __init__(self, id, name, credit):
         super().__init__(id, name, credit)  # Call to the parent class's constructor to initialize common attributes
         self.semester = "All"  # Core courses are typically conducted in all semesters
 
 
 class ElectiveCourse(Course):  # This class is designed for the Elective Courses, which may not be taken by all students and can vary by semeste
+    __slots__ = ('semester',)
+
     def __init__(self, id, name, credit, semester):
         super().__init__(id, name, credit)  # Call to the parent class' constructor to initialize its common attributes
         self.semester = semester  # Elective courses are semester-specific, so this attribute stores the semester the course is held in
 
 class Student:
+    metric_hits = 0  # how many times student_metrics was answered from the cache, shared by every student
+    metric_misses = 0  # and how many times the metrics had to be worked out
+    # slots instead of a __dict__ per student, at millions of students the dictionaries alone take hundreds of megabytes
+    __slots__ = ('id', 'name', 'student_type', 'courses', 'mode', 'metrics')
+
     def __init__(self, id, name, student_type):
         self.id = id  # The unique identifier for the student a student id is unique
         self.name = name  # The name of the student
         self.student_type = student_type  # The type of student (e.g., UG, PG)
         self.courses = {}  # A dictionary to store the courses the student is enrolled in, keyed by course_id with scores as values like COSC or ISYS
+        # (Results(compact=True) swaps it for a CompactScores and Results(columnar=True) for a StoreScores, both are
+        # used just like the dictionary)
         self.mode = None  
+        self.metrics = None  # the cached result of student_metrics, cleared whenever the courses change
 
     def add_course(self, course_id, score):
         self.courses[course_id] = score  # this exists to add the course to the student's course dictionary with the corresponding score
-    
+        self.metrics = None
+
+    def remove_course(self, course_id):
+        # deletes an enrollment and returns the score it had
+        score = self.courses.pop(course_id)
+        self.metrics = None
+        return score
+
+    def add_courses(self, scores):
+        # adds a whole dictionary of course scores at once
+        self.courses.update(scores)
+        self.metrics = None
+
+    def student_metrics(self, courses=None):
+        # works out every metric of the student in one pass over the scores and caches them until add_course,
+        # add_courses or remove_course changes the student (changing self.courses directly skips this, so don't).
+        # courses is the course dictionary of Results, it is only needed for the weighted GPA and the credits
+        # in it are expected to stay the same
+        if self.metrics is not None and (courses is None or self.metrics['wgpa_4'] is not None):
+            Student.metric_hits += 1
+            return self.metrics
+        if type(self.courses) is StoreScores:
+            # the sums of the vectorized pass of the store are the cache of a columnar student, unless it changed since
+            metrics = self.courses.store.row_metrics(self.courses.row)
+            if metrics is not None:
+                Student.metric_hits += 1
+                return metrics
+        Student.metric_misses += 1
+        total = 0
+        finished = 0
+        ongoing = 0
+        weighted_sum = 0
+        total_credits = 0
+        for course_id, score in self.courses.items():
+            if score == '--':
+                ongoing += 1
+                continue
+            total += score
+            finished += 1
+            if courses is not None:
+                weighted_sum += score / 25 * courses[course_id].credit  # this calculates the weighted sum of scores
+                total_credits += courses[course_id].credit  # this calculates the total credits
+        gpa_100 = total / finished if finished > 0 else 0
+        self.metrics = {
+            'gpa_100': gpa_100,
+            'gpa_4': gpa_100 / 25 if finished > 0 else 0,  # converts GPA to a 4-point scale
+            'wgpa_4': None if courses is None else (weighted_sum / total_credits if total_credits > 0 else 0),
+            'finished': finished,
+            'ongoing': ongoing,
+        }
+        return self.metrics
+
     def calculate_gpa(self):
         # this function defines the GPA based on the scores of completed courses.
         # GPA is calculated on a 100-point scale and a 4-point scale.
-        completed_courses = [score for score in self.courses.values() if score != '--']  # This filter helps remove out the completed courses
-        if completed_courses:
-            gpa_100 = sum(completed_courses) / len(completed_courses)  
-            gpa_4 = gpa_100 / 25  # converts GPA to a 4-point scale
-            return gpa_100, gpa_4
-        else:
-            return 0, 0
+        metrics = self.student_metrics()
+        return metrics['gpa_100'], metrics['gpa_4']
 
     def number_courses_finished(self):
         # this function calculates the number of courses that the student has finished
-        return len([score for score in self.courses.values() if score != '--'])
+        return self.student_metrics()['finished']
 
     def number_courses_ongoing(self):
         # calculates the number of courses that the student is currently enrolled in
-        return len([score for score in self.courses.values() if score == '--'])
+        return self.student_metrics()['ongoing']
 
     def satisfies_enrollment(self):
         # checks if the student is enrolled in at least the minimum number of courses
@@ -67,165 +189,1472 @@ class Student:
 
     def weighted_gpa_4(self, courses):
         # calculates the weighted GPA on a 4-point scale, taking into account the credit value of each course
-        weighted_sum = 0
-        total_credits = 0
-        for course_id, score in self.courses.items():
-            if score != '--':
-                weighted_sum += score / 25 * courses[course_id].credit  # this calculates the weighted sum of scores
-                total_credits += courses[course_id].credit  # this calculates the total credits
-        return weighted_sum / total_credits if total_credits > 0 else 0  
+        return self.student_metrics(courses)['wgpa_4']
 
     def average_score_100(self):
         # Calculate the average score on a 100-point scale
-        completed_courses = [score for score in self.courses.values() if score != '--']  # filters out the completed courses
-        if completed_courses:
-            gpa_100 = sum(completed_courses) / len(completed_courses)  # calculates the average score, just like done before
-            return gpa_100
-        else:
-            return 0
+        return self.student_metrics()['gpa_100']
 
     def average_score_4(self):
         # calculates the average score on a 4-point scale
-        completed_courses = [score for score in self.courses.values() if score != '--']  # filters out the completed courses
-        if completed_courses:
-            gpa_100 = sum(completed_courses) / len(completed_courses)  # calculates the average score
-            gpa_4 = gpa_100 / 25  #convert the average score to a 4-point scale
-            return gpa_4
-        else:
-            return 0
+        return self.student_metrics()['gpa_4']
+
+    @staticmethod
+    def reset_metric_counters():
+        Student.metric_hits = 0
+        Student.metric_misses = 0
 
 class UndergraduateStudent(Student):
+    __slots__ = ()
     min_courses = 4  # this is the minimum number of courses an undergraduate student should be enrolled in.
     def __init__(self, id, name):
         super().__init__(id, name, 'UG')  # this inherits from the Student class and set the student type as 'UG' for undergraduate.
 
 
 class PostgraduateStudent(Student):
+    __slots__ = ()
+
     def __init__(self, id, name, mode):
         super().__init__(id, name, 'PG')  # This inherits from the Student class and set the student type as 'PG' for postgraduate.
         self.mode = mode  # mode of study for the postgraduate student can be 'PT' for part-time or 'FT' for full-time.
+
+    @property
+    def min_courses(self):
         # The minimum number of courses a postgraduate student should be enrolled in depends on their mode of study.
-        self.min_courses = 2 if mode == 'PT' else 4 #if part time, the student can be enrolled in 2 courses, if not, it is 4
+        # it is worked out from the mode instead of being stored in every student
+        return 2 if self.mode == 'PT' else 4 #if part time, the student can be enrolled in 2 courses, if not, it is 4
 
-class Results:
+
+ONGOING_SCORE = float('nan')  # how '--' is stored in the fixed width score arrays of CompactScores and the snapshot
+
+
+class CompactScores(MutableMapping):  # the {course_id: score} of one student kept in a single array of doubles
+    # the array holds (course number, score) pairs, 16 bytes an enrollment instead of a dictionary entry, a float
+    # object and a course ID string. The course numbers are shared by every CompactScores through course_ids and
+    # course_numbers, and '--' is stored as ONGOING_SCORE. It reads and writes like the dictionary it replaces ('--'
+    # in, '--' out), a lookup goes over the pairs one by one which is quick for the handful of courses a student takes
+    __slots__ = ('pairs',)
+    course_ids = []  # course number -> course ID
+    course_numbers = {}  # course ID -> course number
+
+    def __init__(self, scores=()):
+        self.pairs = array('d')
+        self.update(scores)
+
+    @classmethod
+    def course_number(cls, course_id):
+        # returns the number of a course ID, numbering it the first time it is seen
+        number = cls.course_numbers.get(course_id)
+        if number is None:
+            number = cls.course_numbers[course_id] = len(cls.course_ids)
+            cls.course_ids.append(sys.intern(course_id))
+        return number
+
+    def position(self, course_id):
+        # where the pair of a course is in self.pairs, or -1 if the student does not take it
+        number = self.course_numbers.get(course_id)
+        if number is not None:
+            pairs = self.pairs
+            for position in range(0, len(pairs), 2):
+                if pairs[position] == number:
+                    return position
+        return -1
+
+    def __getitem__(self, course_id):
+        position = self.position(course_id)
+        if position < 0:
+            raise KeyError(course_id)
+        score = self.pairs[position + 1]
+        return '--' if score != score else score  # NaN is the only value not equal to itself
+
+    def __setitem__(self, course_id, score):
+        value = ONGOING_SCORE if score == '--' else float(score)
+        position = self.position(course_id)
+        if position < 0:
+            self.pairs.extend((self.course_number(course_id), value))
+        else:
+            self.pairs[position + 1] = value
+
+    def __delitem__(self, course_id):
+        position = self.position(course_id)
+        if position < 0:
+            raise KeyError(course_id)
+        del self.pairs[position:position + 2]
+
+    def __iter__(self):
+        course_ids = self.course_ids
+        return (course_ids[int(number)] for number in self.pairs[::2])
+
+    def __len__(self):
+        return len(self.pairs) // 2
+
+    def __repr__(self):
+        return f"CompactScores({dict(self)})"
+
+    def __reduce__(self):
+        # the course numbers only mean something in this process, so a pickled copy carries the course IDs
+        return CompactScores, (dict(self),)
+
+
+NUMPY_TYPES = {'q': 'int64', 'i': 'int32', 'd': 'float64'}  # the numpy type of every array.array typecode ScoreStore uses
+
+
+def to_numpy(values, dtype):
+    # a numpy copy of an array.array, a view would lock the array against growing
+    return np.frombuffer(values, dtype=dtype).copy()
+
+
+def to_array(typecode, values):
+    # an array.array holding the values of a numpy array
+    result = array(typecode)
+    result.frombytes(values.astype(NUMPY_TYPES[typecode]).tobytes())
+    return result
+
+
+class ScoreStore:  # every score of a Results in one set of CSR arrays, used by Results(columnar=True)
+    # the scores of row r are enrollment_course / enrollment_score[offsets[r]:offsets[r + 1]] (course numbers and
+    # doubles with ONGOING_SCORE for '--'), 12 bytes an enrollment and no dictionary per student. Every Student reads
+    # and writes its row through a StoreScores. A load appends to the pending arrays and finish turns them into CSR
+    # arrays and works out the sums of every row and the counters of every course in one vectorized pass. After that
+    # a corrected score is changed in place, a row that gains or loses a course is moved into a dictionary in
+    # overflow until the next finish, and the rows changed since the pass are in stale
     def __init__(self):
+        if np is None:
+            raise ImportError("Error: numpy is needed for the columnar score store.")
+        self.rows = 0  # the number of rows, the row of a student is kept by its StoreScores
+        self.course_ids = []  # course number -> course ID
+        self.course_numbers = {}  # course ID -> course number
+        self.credits = array('d')  # the credit of every course number
+        self.offsets = array('q', [0])
+        self.enrollment_course = array('i')
+        self.enrollment_score = array('d')
+        self.pending_rows = array('q')  # the scores appended by a load that is not finished yet, in the order they were read
+        self.pending_courses = array('i')
+        self.pending_scores = array('d')
+        self.overflow = {}  # row -> {course_id: score} for the rows that gained or lost a course since finish
+        self.stale = set()
+        self.sums = None  # (total, finished, ongoing, weighted sum, credits) of every row, from run_pass
+
+    def add_course(self, course_id, credit):
+        # numbers a course the first time it is read, a course read again only gets its new credit
+        number = self.course_numbers.get(course_id)
+        if number is None:
+            self.course_numbers[course_id] = len(self.course_ids)
+            self.course_ids.append(course_id)
+            self.credits.append(credit)
+        elif self.credits[number] != credit:
+            self.credits[number] = credit
+            self.sums = None  # every weighted sum with this course in it is wrong now
+
+    def add_row(self):
+        # returns the number of a new, empty row
+        self.rows += 1
+        return self.rows - 1
+
+    def append(self, row, course_id, score):
+        # adds a score read by a load, it only shows in the rows once finish has run
+        self.pending_rows.append(row)
+        self.pending_courses.append(self.course_numbers[course_id])
+        self.pending_scores.append(ONGOING_SCORE if score == '--' else score)
+
+    def append_shard(self, rows, shard):
+        # adds every score of a ResultShard like append, rows is the row of every student of the shard
+        numbers = np.array([self.course_numbers[course_id] for course_id in shard.course_ids], dtype=np.int32)
+        counts = np.diff(to_numpy(shard.offsets, np.int64))
+        self.pending_rows.extend(to_array('q', np.repeat(np.array(rows, dtype=np.int64), counts)))
+        self.pending_courses.extend(to_array('i', numbers[to_numpy(shard.enrollment_course, np.int32)]))
+        self.pending_scores.extend(shard.enrollment_score)
+
+    def row_items(self, row):
+        # the (course_id, score) pairs of a row in the order they were first added, like the items of a dictionary
+        scores = self.overflow.get(row)
+        if scores is not None:
+            return list(scores.items())
+        if row + 1 >= len(self.offsets):
+            return []  # a student read after the last finish
+        start, end = self.offsets[row], self.offsets[row + 1]
+        course_ids = self.course_ids
+        return [(course_ids[course], '--' if score != score else score)  # NaN is the only value not equal to itself
+                for course, score in zip(self.enrollment_course[start:end], self.enrollment_score[start:end])]
+
+    def position(self, row, course_id):
+        # where the score of a course is in the CSR arrays, or -1 if the row does not have it there
+        number = self.course_numbers.get(course_id)
+        if number is not None and row + 1 < len(self.offsets):
+            enrollment_course = self.enrollment_course
+            for position in range(self.offsets[row], self.offsets[row + 1]):
+                if enrollment_course[position] == number:
+                    return position
+        return -1
+
+    def get(self, row, course_id):
+        scores = self.overflow.get(row)
+        if scores is not None:
+            return scores[course_id]
+        position = self.position(row, course_id)
+        if position < 0:
+            raise KeyError(course_id)
+        score = self.enrollment_score[position]
+        return '--' if score != score else score
+
+    def set(self, row, course_id, score):
+        scores = self.overflow.get(row)
+        if scores is None:
+            position = self.position(row, course_id)
+            if position >= 0:
+                self.enrollment_score[position] = ONGOING_SCORE if score == '--' else score
+                self.stale.add(row)
+                return
+            scores = self.overflow[row] = dict(self.row_items(row))
+        scores[course_id] = score
+        self.stale.add(row)
+
+    def delete(self, row, course_id):
+        scores = self.overflow.get(row)
+        if scores is None:
+            if self.position(row, course_id) < 0:
+                raise KeyError(course_id)
+            scores = self.overflow[row] = dict(self.row_items(row))
+        del scores[course_id]
+        self.stale.add(row)
+
+    def length(self, row):
+        scores = self.overflow.get(row)
+        if scores is not None:
+            return len(scores)
+        return self.offsets[row + 1] - self.offsets[row] if row + 1 < len(self.offsets) else 0
+
+    def finish(self):
+        # merges the pending scores and the overflow rows into new CSR arrays. A score read again replaces the
+        # earlier one but keeps its place, like in a dictionary. Returns the (total score, finished, ongoing) arrays of
+        # every course and the number of finished and passed scores. The course totals are summed in the order the
+        # scores were read, so they are the same as adding the rows to the courses one by one
+        offsets = to_numpy(self.offsets, np.int64)
+        rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        courses = to_numpy(self.enrollment_course, np.int32)
+        scores = to_numpy(self.enrollment_score, np.float64)
+        if self.overflow:
+            keep = ~np.isin(rows, np.fromiter(self.overflow, dtype=np.int64))
+            entries = [(row, self.course_numbers[course_id], ONGOING_SCORE if score == '--' else score)
+                       for row, row_scores in self.overflow.items() for course_id, score in row_scores.items()]
+            overflow_rows, overflow_courses, overflow_scores = (np.array(column) for column in zip(*entries)) if entries else ([], [], [])
+            rows = np.concatenate([rows[keep], np.asarray(overflow_rows, dtype=np.int64)])
+            courses = np.concatenate([courses[keep], np.asarray(overflow_courses, dtype=np.int32)])
+            scores = np.concatenate([scores[keep], np.asarray(overflow_scores, dtype=np.float64)])
+        rows = np.concatenate([rows, to_numpy(self.pending_rows, np.int64)])
+        courses = np.concatenate([courses, to_numpy(self.pending_courses, np.int32)])
+        scores = np.concatenate([scores, to_numpy(self.pending_scores, np.float64)])
+        # one key per (row, course), the first and the last time every key was read
+        keys = rows * max(len(self.course_ids), 1) + courses
+        unique_keys, first = np.unique(keys, return_index=True)
+        last = len(keys) - 1 - np.unique(keys[::-1], return_index=True)[1]
+        kept = last[np.lexsort((first, rows[first]))]  # by row, then by where the course was first read
+        counts = np.bincount(rows[kept], minlength=self.rows)
+        self.offsets = to_array('q', np.concatenate([[0], np.cumsum(counts)]))
+        self.enrollment_course = to_array('i', courses[kept])
+        self.enrollment_score = to_array('d', scores[kept])
+        self.pending_rows, self.pending_courses, self.pending_scores = array('q'), array('i'), array('d')
+        self.overflow = {}
+        self.run_pass()
+        read = np.sort(last)  # the scores that are kept, in the order they were read
+        read_courses, read_scores = courses[read], scores[read]
+        finished = ~np.isnan(read_scores)
+        course_count = len(self.course_ids)
+        return (np.bincount(read_courses[finished], read_scores[finished], course_count),
+                np.bincount(read_courses[finished], minlength=course_count),
+                np.bincount(read_courses[~finished], minlength=course_count),
+                int(np.count_nonzero(finished)), int(np.count_nonzero(read_scores[finished] >= 49.5)))
+
+    def run_pass(self):
+        # the vectorized pass over the CSR arrays, the sums student_metrics needs for every row at once
+        offsets = to_numpy(self.offsets, np.int64)
+        rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        courses = to_numpy(self.enrollment_course, np.int32)
+        scores = to_numpy(self.enrollment_score, np.float64)
+        finished = ~np.isnan(scores)
+        finished_rows, finished_scores = rows[finished], scores[finished]
+        credits = to_numpy(self.credits, np.float64)[courses[finished]]
+        size = self.rows
+        # one line of sums per row, so row_metrics gets a row with a single lookup
+        self.sums = np.column_stack([np.bincount(finished_rows, finished_scores, size), np.bincount(finished_rows, minlength=size),
+                                     np.bincount(rows[~finished], minlength=size), np.bincount(finished_rows, finished_scores / 25 * credits, size),
+                                     np.bincount(finished_rows, credits, size)])
+        self.stale = set(self.overflow)
+
+    def row_metrics(self, row):
+        # the student_metrics of a row from the sums of the pass, or None if the row has changed since
+        if self.sums is None:
+            self.run_pass()
+        if row in self.stale or row >= len(self.sums):
+            return None
+        total, finished, ongoing, weighted_sum, total_credits = self.sums[row].tolist()
+        finished = int(finished)
+        gpa_100 = total / finished if finished > 0 else 0
+        return {
+            'gpa_100': gpa_100,
+            'gpa_4': gpa_100 / 25 if finished > 0 else 0,
+            'wgpa_4': weighted_sum / total_credits if total_credits > 0 else 0,
+            'finished': finished,
+            'ongoing': int(ongoing),
+        }
+
+
+class StoreScores(MutableMapping):  # the {course_id: score} of one student, read from its row of a ScoreStore
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, course_id):
+        return self.store.get(self.row, course_id)
+
+    def __setitem__(self, course_id, score):
+        self.store.set(self.row, course_id, score)
+
+    def __delitem__(self, course_id):
+        self.store.delete(self.row, course_id)
+
+    def __iter__(self):
+        return (course_id for course_id, score in self.store.row_items(self.row))
+
+    def __len__(self):
+        return self.store.length(self.row)
+
+    def items(self):
+        # one slice of the arrays instead of a lookup per course
+        return self.store.row_items(self.row)
+
+    def __repr__(self):
+        return f"StoreScores({dict(self.items())})"
+
+
+RANKING_BUCKET_SIZE = 1000  # a SortedBuckets bucket is split in two halves of this size once it grows past twice this
+
+
+class SortedBuckets:  # a sorted list kept as a list of short sorted buckets, like the SortedList of sortedcontainers
+    # with one flat list every insert or delete shifts every entry after it, O(n) per update. Here the bucket of an
+    # entry is found with bisect on the last entry of every bucket (O(log n)) and only that bucket is shifted, which is
+    # at most 2 * RANKING_BUCKET_SIZE entries whatever the size of the list. Splitting a full bucket and dropping an
+    # empty one shift the list of buckets, which is n / RANKING_BUCKET_SIZE long and only happens every
+    # RANKING_BUCKET_SIZE updates or so. The entries must be unique, as the (sort value, order, ID) entries are
+    def __init__(self):
+        self.buckets = []
+        self.maxes = []  # the last (largest) entry of every bucket
+        self.size = 0
+
+    def add(self, entry):
+        buckets, maxes = self.buckets, self.maxes
+        self.size += 1
+        if not buckets:
+            buckets.append([entry])
+            maxes.append(entry)
+            return
+        position = bisect_left(maxes, entry)
+        if position == len(maxes):  # larger than every entry, it goes at the end of the last bucket
+            position -= 1
+            buckets[position].append(entry)
+            maxes[position] = entry
+        else:
+            insort(buckets[position], entry)
+        bucket = buckets[position]
+        if len(bucket) > 2 * RANKING_BUCKET_SIZE:
+            buckets[position:position + 1] = [bucket[:RANKING_BUCKET_SIZE], bucket[RANKING_BUCKET_SIZE:]]
+            maxes[position:position + 1] = [bucket[RANKING_BUCKET_SIZE - 1], bucket[-1]]
+
+    def remove(self, entry):
+        position = bisect_left(self.maxes, entry)
+        bucket = self.buckets[position]
+        del bucket[bisect_left(bucket, entry)]
+        self.size -= 1
+        if bucket:
+            self.maxes[position] = bucket[-1]
+        else:
+            del self.buckets[position]
+            del self.maxes[position]
+
+    def count_above(self, key):
+        # the number of entries greater than key, O(log n) to find the bucket plus a sum over the bucket lengths after it
+        position = bisect_right(self.maxes, key)
+        if position == len(self.maxes):
+            return 0
+        return (len(self.buckets[position]) - bisect_right(self.buckets[position], key)
+                + sum(len(bucket) for bucket in islice(self.buckets, position + 1, None)))
+
+    def __iter__(self):
+        return chain.from_iterable(self.buckets)
+
+    def __len__(self):
+        return self.size
+
+
+class RankingIndex:  # sorted leaderboards of students by WGPA and courses by average score
+    # the students are split by (type, mode) and the courses by 'core' / 'elective', every split is a SortedBuckets of
+    # (sort value, order, ID) so the best or worst k are at the front and a rank is found with bisect.
+    # order is the order the item was first indexed in, so ties are won by the first item just like with max and min
+    def __init__(self):
+        self.partitions = {}  # (kind, partition) -> SortedBuckets of entries, kind is 'student' or 'course'
+        self.entries = {}  # (kind, ID) -> (partition, entry), so the entry can be found again when it has to move
+        self.next_order = 0
+
+    def put(self, kind, item_id, partition, sort_value):
+        # adds an item or moves it to its new place, O(log n) to find the place plus a shift of one bucket of at most
+        # 2 * RANKING_BUCKET_SIZE entries (see SortedBuckets)
+        old = self.entries.get((kind, item_id))
+        if old is not None:
+            old_partition, old_entry = old
+            if old_partition == partition and old_entry[0] == sort_value:
+                return  # nothing has changed
+            self.partitions[(kind, old_partition)].remove(old_entry)
+            order = old_entry[1]
+        else:
+            order = self.next_order
+            self.next_order += 1
+        entry = (sort_value, order, item_id)
+        entries = self.partitions.get((kind, partition))
+        if entries is None:
+            entries = self.partitions[(kind, partition)] = SortedBuckets()
+        entries.add(entry)
+        self.entries[(kind, item_id)] = (partition, entry)
+
+    def matching_partitions(self, kind, match):
+        return [self.partitions[key] for key in self.partitions if key[0] == kind and match(key[1])]
+
+    def update_student(self, student, wgpa):
+        # students are sorted on the negative WGPA so the best student comes first
+        self.put('student', student.id, (student.student_type, student.mode or 'FT'), -wgpa)  # UG students are always FT
+
+    def update_course(self, course, average):
+        self.put('course', course.id, 'core' if isinstance(course, CoreCourse) else 'elective', average)
+
+    def top_students(self, k, student_type=None, mode=None):
+        # returns the k best (student ID, WGPA), optionally only of one type ('UG', 'PG') and / or mode ('FT', 'PT'),
+        # the splits are already sorted so merging their fronts takes O(k) steps
+        partitions = self.matching_partitions('student', lambda partition: student_type in (None, partition[0]) and mode in (None, partition[1]))
+        return [(student_id, -value) for value, order, student_id in islice(heapq.merge(*partitions), k)]
+
+    def bottom_courses(self, k, course_type=None):
+        # returns the k (course ID, average score) with the lowest average, optionally only 'core' or 'elective' ones
+        partitions = self.matching_partitions('course', lambda partition: course_type in (None, partition))
+        return [(course_id, value) for value, order, course_id in islice(heapq.merge(*partitions), k)]
+
+    def percentile_rank(self, student_id, student_type=None, mode=None):
+        # returns the percentage of students (of the given type and mode, all of them by default) with a lower WGPA
+        partition, (value, order, _) = self.entries[('student', student_id)]
+        partitions = self.matching_partitions('student', lambda partition: student_type in (None, partition[0]) and mode in (None, partition[1]))
+        total = sum(len(entries) for entries in partitions)
+        # the entries are sorted best first, so the lower ones are everything after the last entry with the same value
+        lower = sum(entries.count_above((value, float('inf'))) for entries in partitions)
+        return 100 * lower / total if total > 0 else 0
+
+
+CHUNK_SIZE = 10000  # the number of rows the streaming loaders parse at a time
+ERROR_POLICIES = ('abort', 'skip', 'quarantine')  # what the loaders can do with a bad row
+REJECTED_SAMPLE = 100  # how many rejected rows a LoadStats keeps, the full list is in the quarantine file
+COURSE_PREFIXES = ('COSC', 'ISYS', 'MATH')  # the only course IDs a results file may have
+
+
+def read_chunks(file, chunk_size=CHUNK_SIZE):
+    # this generator splits a comma separated file into rows and yields them in lists of chunk_size rows, so only one
+    # chunk is held in memory no matter how big the file is. Every line is split on every comma with no quoting (the
+    # files have no quoted fields), so a stray quote is just part of its field and a very long line is one bad row,
+    # neither can swallow the lines after it or stop the load with a csv error
+    while True:
+        lines = list(islice(file, chunk_size))
+        if not lines:
+            return
+        yield [line.rstrip('\r\n').split(',') for line in lines]
+
+
+def parse_result_row(row):
+    # checks one row of a results file and returns the student ID, the course ID and the score ('--' if ongoing),
+    # a ValueError with the message for the user is raised when the row is invalid
+    if len(row) < 3:
+        raise ValueError(f"Error: Invalid result row {','.join(row)}. A result needs a student ID, a course ID and a score.")
+    # the course ID is interned so the millions of results share one string per course instead of one per row
+    student_id, course_id, score = row[0], sys.intern(row[1].strip()), row[2].strip()
+    # checking for valid student IDs to ensure they begin with S.
+    if not student_id.startswith('S'):
+        raise ValueError(f"Error: Invalid student ID {student_id}. Student ID must start with 'S'.")
+    # checking for valid course ID as the course is either cosc, isys, orr math.
+    if not course_id.startswith(COURSE_PREFIXES):
+        raise ValueError(f"Error: Invalid course ID {course_id}. Course ID must start with 'COSC', 'ISYS', or 'MATH'.")
+    # checking if score is empty.
+    if score == '':
+        return student_id, course_id, '--'
+    try:
+        value = float(score)  #converting the score to a float so it can be evaluated.
+        if not math.isfinite(value):
+            raise ValueError  # float() also reads 'nan' and 'inf', which would break every total and average they are added to
+    except ValueError:
+        raise ValueError(f"Error: Invalid score value for student {student_id} in course {course_id}. The score must be a valid number.")
+    return student_id, course_id, value
+
+
+def add_checked_row(row, add_row, stats):
+    # hands one row to add_row, a row that add_row rejects with a ValueError is dealt with by the error policy of
+    # stats. Returns False when the load has to stop
+    if not any(field.strip() for field in row):
+        return True  # blank lines are not counted as rows
+    row[0] = row[0].lstrip()  # this does the same as stripping the whole line before splitting it
+    row[-1] = row[-1].rstrip()
+    stats.rows += 1
+    try:
+        add_row(row)
+    except ValueError as error:
+        return stats.reject(row, str(error))
+    return True
+
+
+def add_rows(chunk, add_row, stats):
+    # the default way of loading a chunk, every row goes through add_checked_row
+    for row in chunk:
+        if not add_checked_row(row, add_row, stats):
+            return False
+    return True
+
+
+def stream_rows(file_name, add_row, stats, chunk_size=CHUNK_SIZE, add_chunk=add_rows):
+    # streams a file through read_chunks and hands every chunk to add_chunk, which returns False when the load has to
+    # stop. A loader with a bulk path passes its own add_chunk, which loads the plain rows in one tight loop and only
+    # hands the rows it cannot deal with to add_checked_row
+    try:
+        with open(file_name, 'r', newline='') as file:
+            for chunk in read_chunks(file, chunk_size):
+                if not add_chunk(chunk, add_row, stats):
+                    return stats
+    finally:
+        stats.finish()
+    return stats
+
+
+def add_to_totals(totals, score, change):
+    # adds (change=1) or takes away (change=-1) one score from [total_score, students_finished, students_ongoing, passed]
+    if score != '--':
+        totals[0] += change * score
+        totals[1] += change
+        if score >= 49.5:
+            totals[3] += change
+    else:
+        totals[2] += change
+
+
+def check_result_ids(student_id, course_id, student_ids, course_ids):
+    # checking that the student and the course of a result were read before.
+    if student_id not in student_ids:
+        raise ValueError(f"Error: Unknown student ID {student_id}.")
+    if course_id not in course_ids:
+        raise ValueError(f"Error: Unknown course ID {course_id}.")
+
+
+shard_student_ids = None  # the student and course IDs known to the parent process, set in every worker by init_shard_worker
+shard_course_ids = None
+
+
+def init_shard_worker(student_ids, course_ids):
+    # runs once in every worker process of Results.read_results_many so the IDs are not sent again with every shard
+    global shard_student_ids, shard_course_ids
+    shard_student_ids, shard_course_ids = student_ids, course_ids
+
+
+class ResultShard:  # the scores parse_result_shard read from one results file, in flat arrays
+    # a worker process sends them back as a few blocks of bytes instead of a pickled dictionary per student, so the
+    # parent unpickles no dictionaries or float objects. The scores of student_ids[i] are enrollment_course /
+    # enrollment_score[offsets[i]:offsets[i + 1]] (numbers into course_ids, ONGOING_SCORE for '--') and course_totals
+    # has the [total_score, students_finished, students_ongoing, passed] of every course in course_ids
+    def __init__(self, student_scores, course_totals):
+        self.course_ids = list(course_totals)  # every course of the shard has totals, even if all its scores were replaced
+        self.course_totals = list(course_totals.values())
+        course_numbers = {course_id: number for number, course_id in enumerate(self.course_ids)}
+        self.student_ids = list(student_scores)
+        self.offsets = array('q', accumulate(map(len, student_scores.values()), initial=0))
+        self.enrollment_course = array('i', [course_numbers[course_id] for scores in student_scores.values() for course_id in scores])
+        self.enrollment_score = array('d', [ONGOING_SCORE if score == '--' else score
+                                            for scores in student_scores.values() for score in scores.values()])
+
+    def columns(self, course_ids):
+        # the course ID and the score ('--' for ongoing) of every enrollment as two lists, course_ids is the list of
+        # course IDs to use in place of self.course_ids (the interned ones of the parent process)
+        return ([course_ids[number] for number in self.enrollment_course],
+                ['--' if score != score else score for score in self.enrollment_score])  # NaN is the only value not equal to itself
+
+
+def parse_result_shard(file_name, error_policy='abort', chunk_size=CHUNK_SIZE, student_ids=None, course_ids=None):
+    # parses one results file into partial aggregates without touching any Student or Course object, so it can run
+    # in a worker process. It returns the LoadStats and a ResultShard with the scores of every student and the
+    # totals of every course. A score read twice in the same file replaces the first one, just like in read_results
+    student_ids = shard_student_ids if student_ids is None else student_ids
+    course_ids = shard_course_ids if course_ids is None else course_ids
+    student_scores = {}
+    course_totals = {}
+
+    def add_row(row):
+        student_id, course_id, score = parse_result_row(row)
+        check_result_ids(student_id, course_id, student_ids, course_ids)
+        scores = student_scores.setdefault(student_id, {})
+        if course_id in scores:
+            add_to_totals(course_totals[course_id], scores[course_id], -1)
+        scores[course_id] = score
+        add_to_totals(course_totals.setdefault(course_id, [0, 0, 0, 0]), score, 1)
+
+    def add_chunk(chunk, add_row, stats):
+        # the same as add_row for a new, valid score, with everything looked up once per chunk. Any other row
+        # (short, blank, badly spaced, invalid or read before) goes through add_checked_row
+        intern, isfinite = sys.intern, math.isfinite
+        loaded = 0
+        try:
+            for row in chunk:
+                try:
+                    student_id, course_id, score = row
+                    course_id = intern(course_id.strip())
+                    score = score.strip()
+                    if score:
+                        score = float(score)
+                        if not isfinite(score):
+                            raise ValueError  # nan and inf are rejected by parse_result_row in add_checked_row
+                    else:
+                        score = '--'
+                except ValueError:
+                    student_id = None
+                if (student_id is None or not student_id.startswith('S') or not course_id.startswith(COURSE_PREFIXES)
+                        or student_id not in student_ids or course_id not in course_ids):
+                    if not add_checked_row(row, add_row, stats):
+                        return False
+                    continue
+                scores = student_scores.get(student_id)
+                if scores is None:
+                    scores = student_scores[student_id] = {}
+                elif course_id in scores:
+                    if not add_checked_row(row, add_row, stats):
+                        return False
+                    continue
+                scores[course_id] = score
+                totals = course_totals.get(course_id)
+                if totals is None:
+                    totals = course_totals[course_id] = [0, 0, 0, 0]
+                if score == '--':
+                    totals[2] += 1
+                else:
+                    totals[0] += score
+                    totals[1] += 1
+                    totals[3] += score >= 49.5
+                loaded += 1
+        finally:
+            stats.rows += loaded
+        return True
+
+    stats = stream_rows(file_name, add_row, LoadStats(file_name, error_policy, verbose=False), chunk_size, add_chunk)
+    return stats, ResultShard(student_scores, course_totals)
+
+
+class LoadStats:  # keeps count of what happened while a file was loaded so it can be reported at the end
+    def __init__(self, file_name, error_policy='abort', quarantine_file=None, verbose=True):
+        if error_policy not in ERROR_POLICIES:
+            raise ValueError(f"Unknown error policy {error_policy}. It must be one of {', '.join(ERROR_POLICIES)}.")
+        self.file_name = file_name
+        self.error_policy = error_policy
+        self.quarantine_file = quarantine_file or file_name + '.rejected'  # where the 'quarantine' policy writes bad rows
+        self.rows = 0  # every non blank row that was read, including the rejected ones
+        self.rejected = 0
+        self.rejected_rows = []  # (row, reason) for the first REJECTED_SAMPLE rejected rows, so memory stays the same however many there are
+        self.verbose = verbose  # when True the reason of every rejected row is printed straight away
+        self.aborted = False
+        self.seconds = 0
+        self.started = time.perf_counter()
+        self.quarantine = None  # the quarantine file is only created once there is something to put in it
+
+    def reject(self, row, reason):
+        # applies the error policy to a bad row, returns False when the load has to stop
+        self.rejected += 1
+        if len(self.rejected_rows) < REJECTED_SAMPLE:
+            self.rejected_rows.append((row, reason))
+        if self.error_policy == 'abort':
+            self.aborted = True
+        elif self.error_policy == 'quarantine':
+            if self.quarantine is None:
+                self.quarantine = open(self.quarantine_file, 'w', newline='')
+            self.quarantine.write(','.join(row) + '\n')  # the line as it was read, so it is split the same way when loaded again
+        if self.verbose:
+            print(self.rejection_message(reason))
+        return not self.aborted
+
+    def rejection_message(self, reason):
+        return reason if self.error_policy == 'abort' else reason + ' Skipping this row.'
+
+    def print_rejected(self):
+        # prints the reasons of the rejected rows, used for the loads that were run quietly in a worker process
+        for row, reason in self.rejected_rows:
+            print(self.rejection_message(reason))
+        if self.rejected > len(self.rejected_rows):
+            where = f", they are all in {self.quarantine_file}" if self.error_policy == 'quarantine' else ''
+            print(f"... and {self.rejected - len(self.rejected_rows)} more rejected rows{where}.")
+
+    def __getstate__(self):
+        # the quarantine file is closed by the time the stats are sent back from a worker process, so it is left out
+        state = self.__dict__.copy()
+        state['quarantine'] = None
+        return state
+
+    def finish(self):
+        # stops the clock and closes the quarantine file
+        self.seconds = time.perf_counter() - self.started
+        if self.quarantine is not None:
+            self.quarantine.close()
+
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds > 0 else 0
+
+    def report(self):
+        print(f"Loaded {self.rows} rows from {self.file_name} in {self.seconds:.2f}s ({self.rows_per_second():.0f} rows/sec), {self.rejected} rejected.")
+
+
+SNAPSHOT_MAGIC = b'SCHF'
+SNAPSHOT_VERSION = 1
+# magic, version, little endian flag, strings, courses, students, enrollments, finished scores, passed scores
+SNAPSHOT_HEADER = struct.Struct('<4sHHIIIQQQ')
+NO_STRING = 0xFFFFFFFF  # the string number used for a missing value, i.e. the mode of an undergraduate student
+# the arrays after the header, in file order, each one starts on an 8 byte boundary. The counts are 'strings',
+# 'courses', 'students', 'enrollments' and 'blob' (the length of the string bytes), '+1' is one more than the count
+SNAPSHOT_SECTIONS = [
+    ('string_offsets', 'Q', 'strings+1'),  # where every string starts and ends in string_blob
+    ('string_blob', 'B', 'blob'),  # every ID, name, semester and mode once, utf-8 encoded
+    ('course_id', 'I', 'courses'),  # string numbers
+    ('course_name', 'I', 'courses'),
+    ('course_semester', 'I', 'courses'),
+    ('course_credit', 'i', 'courses'),
+    ('course_type', 'B', 'courses'),  # 0 for core, 1 for elective
+    ('course_total', 'd', 'courses'),  # the counters of every course, so they do not have to be added up again
+    ('course_finished', 'I', 'courses'),
+    ('course_ongoing', 'I', 'courses'),
+    ('student_id', 'I', 'students'),
+    ('student_name', 'I', 'students'),
+    ('student_type', 'B', 'students'),  # 0 for UG, 1 for PG
+    ('student_mode', 'I', 'students'),
+    ('student_offsets', 'Q', 'students+1'),  # the enrollments of student i are enrollment_course[offsets[i]:offsets[i + 1]]
+    ('enrollment_course', 'I', 'enrollments'),  # course numbers
+    ('enrollment_score', 'd', 'enrollments'),  # ONGOING_SCORE for ongoing courses
+]
+
+
+def padding(size):
+    return -size % 8  # the number of bytes needed to get to the next 8 byte boundary
+
+
+class Snapshot:  # a read only view of a snapshot file written by Results.save_snapshot
+    # the file is memory-mapped and every section is a memoryview cast to its fixed width type, so nothing is read
+    # until it is used. Results.load_snapshot turns it back into Course and Student objects with to_results
+    def __init__(self, file_name):
+        self.file = open(file_name, 'rb')
+        self.map = None
+        if os.fstat(self.file.fileno()).st_size < SNAPSHOT_HEADER.size:  # an empty file cannot even be memory-mapped
+            self.close()
+            raise ValueError(f"Error: {file_name} is not a ScholaFlex snapshot.")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self.map[:SNAPSHOT_HEADER.size]
+        if header[:4] != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError(f"Error: {file_name} is not a ScholaFlex snapshot.")
+        magic, version, little_endian, strings, courses, students, enrollments, self.total_scores, self.passed_scores = SNAPSHOT_HEADER.unpack(header)
+        if version != SNAPSHOT_VERSION or little_endian != (sys.byteorder == 'little'):
+            self.close()
+            raise ValueError(f"Error: {file_name} is a version {version} snapshot, this program reads version {SNAPSHOT_VERSION} on this machine.")
+        self.counts = {'strings': strings, 'courses': courses, 'students': students, 'enrollments': enrollments}
+        view = memoryview(self.map)
+        file_size = len(self.map)
+        self.sections = {}
+        position = SNAPSHOT_HEADER.size + padding(SNAPSHOT_HEADER.size)
+        for name, typecode, count in SNAPSHOT_SECTIONS:
+            if count == 'blob':
+                length = self.sections['string_offsets'][-1]
+            else:
+                length = self.counts[count.split('+')[0]] + count.endswith('+1')
+            size = length * struct.calcsize(typecode)
+            if position + size > file_size:
+                # a save that was cut short, every section has to be there in full or the counts mean nothing
+                view.release()
+                self.close()
+                raise ValueError(f"Error: {file_name} is truncated, its {name} section ends at byte {position + size} "
+                                 f"but the file is {file_size} bytes long.")
+            self.sections[name] = view[position:position + size].cast(typecode)
+            position += size + padding(size)
+        view.release()
+        if self.sections['student_offsets'][-1] != enrollments:
+            self.close()
+            raise ValueError(f"Error: {file_name} is corrupt, its students have {self.sections['student_offsets'][-1]} "
+                             f"enrollments but the header says {enrollments}.")
+
+    def string(self, number):
+        if number == NO_STRING:
+            return None
+        offsets = self.sections['string_offsets']
+        return bytes(self.sections['string_blob'][offsets[number]:offsets[number + 1]]).decode('utf-8')
+
+    def student_scores(self, student_number, course_ids):
+        # returns the {course_id: score} of one student, course_ids is the list of course IDs in snapshot order
+        offsets = self.sections['student_offsets']
+        start, end = offsets[student_number], offsets[student_number + 1]
+        scores = self.sections['enrollment_score'][start:end]
+        return {course_ids[course]: '--' if score != score else score  # NaN is the only value not equal to itself
+                for course, score in zip(self.sections['enrollment_course'][start:end], scores)}
+
+    def to_results(self, compact=False, columnar=False):
+        # builds a Results with every course and student of the snapshot, no text has to be parsed or checked. A
+        # columnar Results takes the enrollment sections as its CSR arrays in one copy
+        results = Results(compact, columnar)
+        store = results.score_store
+        strings = [self.string(number) for number in range(self.counts['strings'])]  # every string is decoded once
+        course_ids = [strings[number] for number in self.sections['course_id']]
+        for number, course_id in enumerate(course_ids):
+            name, credit = strings[self.sections['course_name'][number]], self.sections['course_credit'][number]
+            if self.sections['course_type'][number] == 0:
+                course = CoreCourse(course_id, name, credit)
+            else:
+                course = ElectiveCourse(course_id, name, credit, strings[self.sections['course_semester'][number]])
+            course.add_score_totals(self.sections['course_total'][number], self.sections['course_finished'][number], self.sections['course_ongoing'][number])
+            results.courses[course_id] = course
+            if store is not None:
+                store.add_course(course_id, credit)  # numbered in snapshot order, so the course numbers are the same
+        for number in range(self.counts['students']):
+            student_id, name = strings[self.sections['student_id'][number]], strings[self.sections['student_name'][number]]
+            if self.sections['student_type'][number] == 0:
+                student = UndergraduateStudent(student_id, name)
+            else:
+                student = PostgraduateStudent(student_id, name, strings[self.sections['student_mode'][number]])
+            if store is not None:
+                student.courses = StoreScores(store, store.add_row())
+            else:
+                scores = self.student_scores(number, course_ids)
+                student.courses = CompactScores(scores) if compact else scores
+            results.students[student_id] = student
+        if store is not None:
+            store.offsets = array('q', self.sections['student_offsets'].tobytes())
+            store.enrollment_course = array('i', self.sections['enrollment_course'].tobytes())
+            store.enrollment_score = array('d', self.sections['enrollment_score'].tobytes())
+        results.total_scores, results.passed_scores = self.total_scores, self.passed_scores
+        return results
+
+    def close(self):
+        # the memoryviews have to be let go of before the map can be closed
+        for section in getattr(self, 'sections', {}).values():
+            section.release()
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+REPORT_FORMATS = ('text', 'csv', 'json')
+REPORT_RULE = '---------------------------------------------------------------------------------------------------'
+REPORT_BUFFER_LIMIT = 1 << 20  # text and csv reports are written out in batches of about this many characters
+REPORT_ROW_BATCH = 10000  # the number of table rows formatted and joined together at a time
+
+
+class ReportWriter:  # builds the report in a buffer and writes it to every sink in one go instead of one print per row
+    # output_format is 'text' (the tables as they have always looked), 'csv' or 'json'. sinks is a list of file-like
+    # objects, by default the sys.stdout of the moment; main also passes the reports.txt file so both get the same report.
+    # A json report is one document, so it is only written out by flush
+    def __init__(self, sinks=None, output_format='text', buffer_limit=REPORT_BUFFER_LIMIT):
+        if output_format not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format {output_format}. It must be one of {', '.join(REPORT_FORMATS)}.")
+        self.sinks = sinks
+        self.output_format = output_format
+        self.buffer_limit = buffer_limit
+        self.buffer = []
+        self.buffered = 0  # the number of characters in the buffer
+        self.items = []  # the headings, lines and tables of a json report
+        self.csv_writer = csv.writer(self, lineterminator='\n')  # the csv rows are written into the buffer through self.write
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_limit:
+            self.write_out()
+
+    def write_out(self):
+        # one write per sink for everything in the buffer
+        text = ''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        if text:
+            for sink in self.sinks or [sys.stdout]:
+                sink.write(text)
+
+    def flush(self):
+        if self.output_format == 'json':
+            self.write(json.dumps(self.items) + '\n')
+            self.items = []
+        self.write_out()
+        for sink in self.sinks or [sys.stdout]:
+            sink.flush()
+
+    def heading(self, text, gap=False):
+        # a section title, gap puts a blank line before it in a text report
+        if self.output_format == 'text':
+            self.write(('\n' if gap else '') + text + '\n')
+        elif self.output_format == 'csv':
+            self.csv_writer.writerow([text])
+        else:
+            self.items.append({'heading': text})
+
+    def line(self, text):
+        # a sentence of a summary
+        if self.output_format == 'text':
+            self.write(text + '\n')
+        elif self.output_format == 'csv':
+            self.csv_writer.writerow([text])
+        else:
+            self.items.append({'line': text})
+
+    def table(self, title, columns, rows, header_template, row_template, rule=None, lines=None):
+        # writes a table, rows can be any iterable (a generator keeps a big table out of memory in text and csv mode).
+        # The templates are format strings with one field per column for the text report, a None row stands for a
+        # rule between two groups of rows. rule is the line drawn around the header, if any. lines, when given, are
+        # the rows already formatted for the text report (without the newline), used instead of row_template so a
+        # very wide table does not go through one format call with a field per column for every row
+        rows = iter(rows)
+        if self.output_format == 'json':
+            self.items.append({'table': title, 'columns': list(columns), 'rows': [list(row) for row in rows if row is not None]})
+            return
+        if self.output_format == 'csv':
+            self.csv_writer.writerow(columns)
+            for batch in iter(lambda: list(islice(rows, REPORT_ROW_BATCH)), []):
+                self.csv_writer.writerows(row for row in batch if row is not None)
+            return
+        if rule:
+            self.write(rule + '\n')
+        self.write(header_template.format(*columns) + '\n')
+        if rule:
+            self.write(rule + '\n')
+        if lines is not None:
+            lines = iter(lines)
+            for batch in iter(lambda: list(islice(lines, REPORT_ROW_BATCH)), []):
+                self.write('\n'.join(batch) + '\n')
+            return
+        row_line = row_template + '\n'
+        rule_line = (rule or '') + '\n'
+        for batch in iter(lambda: list(islice(rows, REPORT_ROW_BATCH)), []):
+            self.write(''.join([rule_line if row is None else row_line.format(*row) for row in batch]))
+
+
+class Results:
+    def __init__(self, compact=False, columnar=False):
+        if compact and columnar:
+            raise ValueError("Error: the compact and the columnar score modes cannot be used together.")
+        self.compact = compact  # the memory-lean mode, every student keeps its scores in a CompactScores
+        # the columnar mode, every score is in one ScoreStore and every student reads its row through a StoreScores
+        self.score_store = ScoreStore() if columnar else None
         self.students = {}  # Student object dictionary key is student ID.
         self.courses = {}  # Course object dictionary key is course ID.
+        self.load_stats = []  # a LoadStats for every file that was read
+        self.total_scores = 0  # the number of finished scores and how many of them passed, kept up to date on every
+        self.passed_scores = 0  # change so display_actual_results does not have to go over every score
+        self.rankings = None  # the RankingIndex, built the first time a leaderboard is asked for and kept up to date after
+
+    def compute_all_metrics(self):
+        # works out (and caches) the metrics of every student and course and builds the ranking index
+        for student in self.students.values():
+            student.student_metrics(self.courses)
+        for course in self.courses.values():
+            course.average_score()
+        self.ranking_index()
+
+    def ranking_index(self):
+        # returns the ranking index, building it on first use
+        if self.rankings is None:
+            self.rankings = RankingIndex()
+            for student in self.students.values():
+                self.rankings.update_student(student, student.weighted_gpa_4(self.courses))
+            for course in self.courses.values():
+                self.rankings.update_course(course, course.average_score())
+        return self.rankings
+
+    def update_rankings(self, student=None, course=None):
+        # moves a changed student and / or course to its new place in the ranking index, if there is one yet
+        if self.rankings is None:
+            return
+        if student is not None:
+            self.rankings.update_student(student, student.weighted_gpa_4(self.courses))
+        if course is not None:
+            self.rankings.update_course(course, course.average_score())
+
+    def top_students(self, k, student_type=None, mode=None):
+        # the k best students by WGPA as (student ID, WGPA), see RankingIndex.top_students
+        return self.ranking_index().top_students(k, student_type, mode)
 
-    def read_courses(self, file_name):
+    def bottom_courses(self, k, course_type=None):
+        # the k hardest courses as (course ID, average score), see RankingIndex.bottom_courses
+        return self.ranking_index().bottom_courses(k, course_type)
+
+    def percentile_rank(self, student_id, student_type=None, mode=None):
+        # the percentage of students with a lower WGPA than this student
+        return self.ranking_index().percentile_rank(student_id, student_type, mode)
+
+    def load_file(self, file_name, add_row, error_policy='abort', quarantine_file=None, chunk_size=CHUNK_SIZE, add_chunk=add_rows):
+        # streams a file through stream_rows, the returned LoadStats is also kept in self.load_stats
+        stats = LoadStats(file_name, error_policy, quarantine_file)
+        self.load_stats.append(stats)
+        return stream_rows(file_name, add_row, stats, chunk_size, add_chunk)
+
+    def read_courses(self, file_name, error_policy='skip', quarantine_file=None, chunk_size=CHUNK_SIZE):
         # This method reads the courses details from a file and populates the courses dictionary.
-        with open(file_name, 'r') as file:
-            for line in file:
-                # this extracts course details from each line of the file.
-                course_id, course_type, course_name, course_credit, *course_semester = line.strip().split(',')
+        # a course with an invalid credit is skipped by default, as suggested in HD or DI
+        stats = self.load_file(file_name, self.add_course_row, error_policy, quarantine_file, chunk_size)
+        stats.report()
+        return stats
+
+    def add_course_row(self, row):
+        # this extracts course details from one row of the courses file.
+        if len(row) < 4:
+            raise ValueError(f"Error: Invalid course row {','.join(row)}. A course needs an ID, a type, a name and a credit.")
+        course_id, course_type, course_name, course_credit, *course_semester = row
+        course_id = sys.intern(course_id)  # the same string object parse_result_row hands out for this course
+        course_semester = [sys.intern(semester) for semester in course_semester]
+        try:
+            # this converts course credit to integer. If it fails, it means the data is invalid.
+            course_credit = int(course_credit)
+        except ValueError:
+            raise ValueError(f"Invalid credit value for course {course_id}.")
+        # If course type is 'C', create a CoreCourse object, else create an ElectiveCourse object.
+        if course_type.strip() == 'C':
+            self.courses[course_id] = CoreCourse(course_id, course_name, course_credit)
+        elif course_type.strip() == 'E':
+            self.courses[course_id] = ElectiveCourse(course_id, course_name, course_credit, course_semester[0] if course_semester else "All") #all semesters have core courses
+        if self.score_store is not None and course_id in self.courses:
+            self.score_store.add_course(course_id, course_credit)
+        if course_id in self.courses:
+            self.update_rankings(course=self.courses[course_id])
+
+    def read_students(self, file_name, error_policy='abort', quarantine_file=None, chunk_size=CHUNK_SIZE):
+        # reads the student details from a file and populates the students dictionary.
+        stats = self.load_file(file_name, self.add_student_row, error_policy, quarantine_file, chunk_size)
+        stats.report()
+        return stats
+
+    def add_student_row(self, row):
+        # extracts student details from one row of the students file.
+        if len(row) < 3:
+            raise ValueError(f"Error: Invalid student row {','.join(row)}. A student needs an ID, a name and a type.")
+        student_id, name, student_type, *mode = row
+        old_courses = self.students[student_id].courses if student_id in self.students else None
+        # if student type is 'UG', create an UndergraduateStudent object, else create a PostgraduateStudent object.
+        if student_type.strip() == 'UG':
+            self.students[student_id] = UndergraduateStudent(student_id, name)
+        elif student_type.strip() == 'PG':
+            if not mode:
+                raise ValueError(f"Error: Postgraduate student {student_id} has no mode of study.")
+            # interned so every PG student shares the one 'FT' and the one 'PT' string, like the 'UG' and 'PG' literals
+            self.students[student_id] = PostgraduateStudent(student_id, name, sys.intern(mode[0].strip()))
+        if self.compact and student_id in self.students:
+            self.students[student_id].courses = CompactScores()
+        if self.score_store is not None and student_id in self.students:
+            # a student read again keeps the row it had
+            row = old_courses.row if type(old_courses) is StoreScores else self.score_store.add_row()
+            self.students[student_id].courses = StoreScores(self.score_store, row)
+        if student_id in self.students:
+            self.update_rankings(student=self.students[student_id])
+
+    def read_results(self, file_name, error_policy='abort', quarantine_file=None, chunk_size=CHUNK_SIZE):
+        # Method to read course results from a file. The file is streamed in chunks of rows so the memory used
+        # stays the same whatever the size of the file. error_policy decides what a bad row does: 'abort' stops the
+        # load (the rows before it are kept), 'skip' collects it in the LoadStats and carries on, and 'quarantine'
+        # also writes it to quarantine_file so it can be fixed and loaded again.
+        try:
+            stats = self.load_file(file_name, self.add_result_row, error_policy, quarantine_file, chunk_size, self.add_result_chunk)
+        finally:
+            if self.score_store is not None:
+                self.finish_score_store()
+        if stats.rows == 0:
+            print("Error: The result file is empty.")  # this is to notify the user that the file is empty.
+        stats.report()
+        return stats
+
+    def add_result_row(self, row):
+        student_id, course_id, score = parse_result_row(row)
+        if self.score_store is not None:
+            # a columnar load appends the score, the store works out the rest in finish_score_store
+            check_result_ids(student_id, course_id, self.students, self.courses)
+            self.score_store.append(self.students[student_id].courses.row, course_id, score)
+            return
+        self.upsert_score(student_id, course_id, score)
+
+    def add_result_chunk(self, chunk, add_row, stats):
+        # the bulk path of read_results: the plain rows (three fields, a valid score and known IDs) are parsed in one
+        # tight loop with everything looked up once per chunk, the rest go through add_checked_row and add_result_row
+        # one at a time so they get the same checks, messages and error policy. A new enrollment is added straight to
+        # the student, the course and the pass rate totals while there is no ranking index to keep up to date, a
+        # score read before (or a load after the index was built) goes through upsert_score
+        if self.score_store is not None:
+            return self.add_store_chunk(chunk, add_row, stats)
+        students, upsert_score = self.students, self.upsert_score
+        # the courses a result may name, course.id is the interned ID parse_result_row would hand out
+        courses = {course_id: course for course_id, course in self.courses.items() if course_id.startswith(COURSE_PREFIXES)}
+        direct = self.rankings is None
+        isfinite = math.isfinite
+        loaded = total_scores = passed_scores = 0
+        try:
+            for row in chunk:
                 try:
-                    # this converts course credit to integer. If it fails, it means the data is invalid.
-                    course_credit = int(course_credit)
+                    student_id, course_id, score = row
+                    score = score.strip()
+                    if score:
+                        score = float(score)
+                        if not isfinite(score):
+                            raise ValueError  # nan and inf are rejected by parse_result_row in add_checked_row
+                    else:
+                        score = '--'
                 except ValueError:
-                    print(f"Invalid credit value for course {course_id}. Skipping this course.") #as suggested in HD or DI 
+                    student = course = None
+                else:
+                    student = students.get(student_id)
+                    course = courses.get(course_id.strip())
+                if student is None or course is None or not student_id.startswith('S'):
+                    if not add_checked_row(row, add_row, stats):
+                        return False
                     continue
-                # If course type is 'C', create a CoreCourse object, else create an ElectiveCourse object.
-                if course_type.strip() == 'C':
-                    self.courses[course_id] = CoreCourse(course_id, course_name, course_credit)
-                elif course_type.strip() == 'E':
-                    self.courses[course_id] = ElectiveCourse(course_id, course_name, course_credit, course_semester[0] if course_semester else "All") #all semesters have core courses
+                loaded += 1
+                course_id = course.id
+                scores = student.courses
+                if not direct or course_id in scores:
+                    upsert_score(student_id, course_id, score)
+                    continue
+                scores[course_id] = score
+                student.metrics = None
+                course.average = None
+                if score == '--':
+                    course.students_ongoing += 1
+                else:
+                    course.total_score += score
+                    course.students_finished += 1
+                    total_scores += 1
+                    passed_scores += score >= 49.5
+        finally:
+            stats.rows += loaded
+            self.total_scores += total_scores
+            self.passed_scores += passed_scores
+        return True
 
-    def read_students(self, file_name):
-        # reads the student details from a file and populates the students dictionary.
-        with open(file_name, 'r') as file:
-            for line in file:
-                # extracts student details from each line of the file.
-                student_id, name, student_type, *mode = line.strip().split(',')
-                # if student type is 'UG', create an UndergraduateStudent object, else create a PostgraduateStudent object.
-                if student_type.strip() == 'UG':
-                    self.students[student_id] = UndergraduateStudent(student_id, name)
-                elif student_type.strip() == 'PG':
-                    self.students[student_id] = PostgraduateStudent(student_id, name, mode[0].strip())
-
-    def read_results(self, file_name):
-        # Method to read course results from a file.
-        with open(file_name, 'r') as file:
-            # this is to check if the file is empty and notify the user.
-            if file.read().strip() == '':
-                print("Error: The result file is empty.")
-                return
-            file.seek(0)  # resetting the file pointer to the start
-            for line in file:
-                # splitting each line into different components.
-                row = line.split(',')
-                student_id, course_id, score = row[0], row[1].strip(), row[2].strip()
-                # checking for valid student IDs to ensure they begin with S.
-                if not student_id.startswith('S'):
-                    print(f"Error: Invalid student ID {student_id}. Student ID must start with 'S'.")
-                    return
-                # checking for valid course ID as the course is either cosc, isys, orr math.
-                if not (course_id.startswith('COSC') or course_id.startswith('ISYS') or course_id.startswith('MATH')):
-                    print(f"Error: Invalid course ID {course_id}. Course ID must start with 'COSC', 'ISYS', or 'MATH'.")
-                    return
-                # checking if score is empty.
-                if score == '':
-                    score = '--'
+    def add_store_chunk(self, chunk, add_row, stats):
+        # add_result_chunk of a columnar load, the plain rows only go into the pending arrays of the ScoreStore as
+        # (row number, course number, score). The rest go through add_checked_row like in add_result_chunk
+        store = self.score_store
+        students = self.students
+        course_numbers = {course_id: number for course_id, number in store.course_numbers.items() if course_id.startswith(COURSE_PREFIXES)}
+        add_row_number, add_course_number, add_score = store.pending_rows.append, store.pending_courses.append, store.pending_scores.append
+        isfinite = math.isfinite
+        loaded = 0
+        try:
+            for row in chunk:
+                try:
+                    student_id, course_id, score = row
+                    score = score.strip()
+                    if score:
+                        score = float(score)
+                        if not isfinite(score):
+                            raise ValueError  # a nan score would read as ongoing, inf would break the sums
+                    else:
+                        score = ONGOING_SCORE
+                except ValueError:
+                    student = course_number = None
                 else:
-                    try:
-                        score = float(score)  #converting the score to a float so it can be evaluated.
-                    except ValueError:
-                        print(f"Error: Invalid score value for student {student_id} in course {course_id}. The score must be a valid number.")
-                        return
-                # adding the score to the student's courses and to the course.
-                self.students[student_id].courses[course_id] = score
-                self.courses[course_id].add_student_score(score)
-
-    def display_course_info(self):
-        # Method to print all the course information. utilizing string manipulating to arrange them in the best way possible
-        print('---------------------------------------------------------------------------------------------------')
-        print('CourseID'.ljust(10)
-              + 'Course Name'.ljust(15)
-              + 'Credit'.ljust(7)
-              + 'Nfinish'.ljust(8)
-              + 'Nongoing'.ljust(9)
-              + 'Average'.ljust(8)) #adjusting the arrangement of the variables as they should appear on the table output
-        print('---------------------------------------------------------------------------------------------------')        
+                    student = students.get(student_id)
+                    course_number = course_numbers.get(course_id.strip())
+                if student is None or course_number is None or not student_id.startswith('S'):
+                    if not add_checked_row(row, add_row, stats):
+                        return False
+                    continue
+                add_row_number(student.courses.row)
+                add_course_number(course_number)
+                add_score(score)
+                loaded += 1
+        finally:
+            stats.rows += loaded
+        return True
+
+    def upsert_score(self, student_id, course_id, score):
+        # adds a score, or replaces the score already there (e.g. a '--' that became a mark), and keeps the course
+        # counters and the pass rate totals right in O(1) instead of reloading everything
+        check_result_ids(student_id, course_id, self.students, self.courses)
+        student = self.students[student_id]
+        course = self.courses[course_id]
+        if course_id in student.courses:
+            self.remove_from_aggregates(course, student.courses[course_id])  # the old score no longer counts
+        # adding the score to the student's courses and to the course.
+        student.add_course(course_id, score)
+        self.add_to_aggregates(course, score)
+        self.update_rankings(student, course)
+
+    def retract_score(self, student_id, course_id):
+        # deletes an enrollment and takes its score back out of every aggregate, the removed score is returned
+        check_result_ids(student_id, course_id, self.students, self.courses)
+        if course_id not in self.students[student_id].courses:
+            raise ValueError(f"Error: Student {student_id} is not enrolled in {course_id}.")
+        score = self.students[student_id].remove_course(course_id)
+        self.remove_from_aggregates(self.courses[course_id], score)
+        self.update_rankings(self.students[student_id], self.courses[course_id])
+        return score
+
+    def add_to_aggregates(self, course, score):
+        course.add_student_score(score)
+        if score != '--':
+            self.total_scores += 1
+            self.passed_scores += score >= 49.5
+
+    def remove_from_aggregates(self, course, score):
+        course.remove_student_score(score)
+        if score != '--':
+            self.total_scores -= 1
+            self.passed_scores -= score >= 49.5
+
+    def read_results_many(self, file_names, workers=None, error_policy='abort', chunk_size=CHUNK_SIZE):
+        # reads several results files (one per faculty or campus) at once. Every file is parsed in a process pool
+        # into partial aggregates by parse_result_shard, and the aggregates are merged in the order of file_names,
+        # so the outcome is the same as calling read_results on each file in turn whatever order the workers finish in.
+        # The error policy applies to every file on its own, 'abort' only stops the file the bad row is in.
+        file_names = list(file_names)
+        workers = workers or os.cpu_count() or 1
+        started = time.perf_counter()
+        try:
+            if workers == 1 or len(file_names) < 2:
+                # one process is enough, the shards are parsed right here
+                shards = (parse_result_shard(file_name, error_policy, chunk_size, self.students, self.courses)
+                          for file_name in file_names)
+                all_stats = [self.merge_result_shard(*shard) for shard in shards]
+            else:
+                with ProcessPoolExecutor(max_workers=min(workers, len(file_names)), initializer=init_shard_worker,
+                                         initargs=(frozenset(self.students), frozenset(self.courses))) as pool:
+                    shards = pool.map(parse_result_shard, file_names, repeat(error_policy), repeat(chunk_size))
+                    all_stats = [self.merge_result_shard(*shard) for shard in shards]  # merging while later shards are parsed
+        finally:
+            if self.score_store is not None:
+                self.finish_score_store()
+        seconds = time.perf_counter() - started
+        rows = sum(stats.rows for stats in all_stats)
+        rejected = sum(stats.rejected for stats in all_stats)
+        print(f"Loaded {rows} rows from {len(file_names)} files in {seconds:.2f}s ({rows / seconds if seconds > 0 else 0:.0f} rows/sec), {rejected} rejected.")
+        return all_stats
+
+    def read_results_files(self, file_names, workers=None, error_policy='abort', chunk_size=CHUNK_SIZE):
+        # reads one results file with read_results or several with read_results_many, the LoadStats are returned in a list
+        if len(file_names) == 1:
+            return [self.read_results(file_names[0], error_policy, chunk_size=chunk_size)]
+        return self.read_results_many(file_names, workers, error_policy, chunk_size)
+
+    def merge_result_shard(self, stats, shard):
+        # adds the partial aggregates of one results file (a ResultShard) to the students and courses
+        self.load_stats.append(stats)
+        stats.print_rejected()
+        if stats.rows == 0:
+            print(f"Error: The result file {stats.file_name} is empty.")
+        students = self.students
+        if self.score_store is not None:
+            # the arrays go into the store as they are, the course counters and the pass rate totals are worked out by
+            # finish_score_store once every shard is in
+            self.score_store.append_shard([students[student_id].courses.row for student_id in shard.student_ids], shard)
+            return stats
+        # every student takes the next end - start pairs, so nothing is sliced or looked up per enrollment
+        pairs = zip(*shard.columns([self.courses[course_id].id for course_id in shard.course_ids]))
+        offsets = shard.offsets.tolist()
+        for student_id, start, end in zip(shard.student_ids, offsets, offsets[1:]):
+            student = students[student_id]
+            scores = islice(pairs, end - start)
+            if student.courses:
+                scores = dict(scores)
+                for course_id in scores.keys() & student.courses.keys():  # scores loaded before this file are replaced
+                    self.remove_from_aggregates(self.courses[course_id], student.courses[course_id])
+            student.add_courses(scores)
+            self.update_rankings(student=student)
+        for course_id, (total_score, students_finished, students_ongoing, passed) in zip(shard.course_ids, shard.course_totals):
+            self.courses[course_id].add_score_totals(total_score, students_finished, students_ongoing)
+            self.total_scores += students_finished
+            self.passed_scores += passed
+            self.update_rankings(course=self.courses[course_id])
+        return stats
+
+    def finish_score_store(self):
+        # finishes a columnar load (see ScoreStore.finish) and puts the course counters and the pass rate totals it
+        # worked out in place. Every student metric and the ranking index are worked out again when next asked for
+        course_totals, course_finished, course_ongoing, self.total_scores, self.passed_scores = self.score_store.finish()
+        for course_id, total_score, students_finished, students_ongoing in zip(self.score_store.course_ids, course_totals.tolist(),
+                                                                                course_finished.tolist(), course_ongoing.tolist()):
+            course = self.courses[course_id]
+            course.total_score = total_score if students_finished > 0 else 0
+            course.students_finished = students_finished
+            course.students_ongoing = students_ongoing
+            course.average = None
+        for student in self.students.values():
+            student.metrics = None
+        self.rankings = None
+
+    def save_snapshot(self, file_name):
+        # writes every course, student and score to a compact binary file (see SNAPSHOT_SECTIONS) that
+        # load_snapshot reads back far quicker than the three text files. Every string is stored once
+        strings = {}  # string -> its number in the string table
+
+        def intern(value):
+            if value is None:
+                return NO_STRING
+            return strings.setdefault(value, len(strings))
+
+        course_numbers = {course_id: number for number, course_id in enumerate(self.courses)}
+        sections = {name: array(typecode) for name, typecode, count in SNAPSHOT_SECTIONS}
         for course in self.courses.values():
-            print(course.id.ljust(10)
-                  + course.name.ljust(15)
-                  + str(course.credit).ljust(7)
-                  + str(course.students_finished).ljust(8)
-                  + str(course.students_ongoing).ljust(9)
-                  + '{:.2f}'.format(course.average_score()).ljust(8))
-
-    def display_course_summary(self): #self-explanatory, this functions displays course summary and meets the Credit requirement
+            sections['course_id'].append(intern(course.id))
+            sections['course_name'].append(intern(course.name))
+            sections['course_semester'].append(intern(course.semester))
+            sections['course_credit'].append(course.credit)
+            sections['course_type'].append(0 if isinstance(course, CoreCourse) else 1)
+            sections['course_total'].append(course.total_score)
+            sections['course_finished'].append(course.students_finished)
+            sections['course_ongoing'].append(course.students_ongoing)
+        sections['student_offsets'].append(0)
+        for student in self.students.values():
+            sections['student_id'].append(intern(student.id))
+            sections['student_name'].append(intern(student.name))
+            sections['student_type'].append(0 if student.student_type == 'UG' else 1)
+            sections['student_mode'].append(intern(student.mode))
+            sections['enrollment_course'].extend(course_numbers[course_id] for course_id in student.courses)
+            sections['enrollment_score'].extend(ONGOING_SCORE if score == '--' else score for score in student.courses.values())
+            sections['student_offsets'].append(len(sections['enrollment_course']))
+        encoded = [string.encode('utf-8') for string in strings]
+        sections['string_blob'] = array('B', b''.join(encoded))
+        sections['string_offsets'].append(0)
+        for value in encoded:
+            sections['string_offsets'].append(sections['string_offsets'][-1] + len(value))
+        # the snapshot is written to a temporary file next to it and renamed over file_name once it is complete, so a
+        # crash or a full disk halfway through leaves the previous snapshot (or nothing) instead of a cut short one
+        temp_name = f"{file_name}.{os.getpid()}.tmp"
+        try:
+            with open(temp_name, 'wb') as file:
+                header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sys.byteorder == 'little', len(strings), len(self.courses),
+                                              len(self.students), len(sections['enrollment_course']), self.total_scores, self.passed_scores)
+                file.write(header + bytes(padding(len(header))))
+                for name, typecode, count in SNAPSHOT_SECTIONS:
+                    data = sections[name].tobytes()
+                    file.write(data + bytes(padding(len(data))))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_name, file_name)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(temp_name)
+            raise
+
+    @classmethod
+    def load_snapshot(cls, file_name, compact=False, columnar=False):
+        # reads a file written by save_snapshot back into a new Results. This builds every Course and Student object
+        # again, so the loaded Results takes as much memory as one loaded from the text files (in the same mode), only
+        # the loading is quicker
+        with Snapshot(file_name) as snapshot:
+            return snapshot.to_results(compact, columnar)
+
+    def display_course_info(self, writer=None):
+        # Method to print all the course information. The rows are formatted with one template into the report
+        # writer (see ReportWriter), which is flushed here unless the caller passed its own
+        own_writer = writer is None
+        writer = writer or ReportWriter()
+        rows = ((course.id, course.name, course.credit, course.students_finished, course.students_ongoing, course.average_score())
+                for course in self.courses.values())
+        writer.table('COURSE INFORMATION', ['CourseID', 'Course Name', 'Credit', 'Nfinish', 'Nongoing', 'Average'], rows,
+                     '{:<10}{:<15}{:<7}{:<8}{:<9}{:<8}',  #adjusting the arrangement of the variables as they should appear on the table output
+                     '{:<10}{:<15}{:<7}{:<8}{:<9}{:<8.2f}', rule=REPORT_RULE)
+        if own_writer:
+            writer.flush()
+
+    def display_course_summary(self, writer=None): #self-explanatory, this functions displays course summary and meets the Credit requirement
         #it also displays the hardest core and elective courses and the average scores in it
-        print('\nCOURSE SUMMARY')
-        core_courses = [course for course in self.courses.values() if isinstance(course, CoreCourse)]
-        elective_courses = [course for course in self.courses.values() if isinstance(course, ElectiveCourse)]
-        if core_courses:
-            most_difficult_course = min(core_courses, key=lambda course: course.average_score())
-            print(f"The most difficult core course is {most_difficult_course.id} with an average score of {most_difficult_course.average_score():.2f}.")
-        if elective_courses:
-            most_difficult_elective = min(elective_courses, key=lambda course: course.average_score())
-            print(f"The most difficult elective course is {most_difficult_elective.id} with an average score of {most_difficult_elective.average_score():.2f}.")
-    def display_results(self):
+        own_writer = writer is None
+        writer = writer or ReportWriter()
+        writer.heading('COURSE SUMMARY', gap=True)
+        # the hardest courses come straight from the front of the ranking index instead of a min over every course
+        for course_id, average in self.bottom_courses(1, 'core'):
+            writer.line(f"The most difficult core course is {course_id} with an average score of {average:.2f}.")
+        for course_id, average in self.bottom_courses(1, 'elective'):
+            writer.line(f"The most difficult elective course is {course_id} with an average score of {average:.2f}.")
+        if own_writer:
+            writer.flush()
+
+    def display_results(self, writer=None):
         #this displays the course information and the student information
         #ignore the function name, it was something I had made and was fairly intertwined with the whole functionality of the program that I
         #felt it would be complicated to change it
-        print('COURSE INFORMATION')
-        self.display_course_info()
-        self.display_course_summary()
-        print('\nSTUDENT INFORMATION')
-        self.display_student_info()
-        self.display_student_summary()
-    def display_actual_results(self): #this displays the results and the summary
+        own_writer = writer is None
+        writer = writer or ReportWriter()
+        writer.heading('COURSE INFORMATION')
+        self.display_course_info(writer)
+        self.display_course_summary(writer)
+        writer.heading('STUDENT INFORMATION', gap=True)
+        self.display_student_info(writer)
+        self.display_student_summary(writer)
+        if own_writer:
+            writer.flush()
+
+    def iter_result_rows(self):
+        # streams the results one student at a time as (student_id, [(course_id, score), ...]), in student ID and
+        # course ID order. Only the courses a student is enrolled in are looked at, so the work is proportional to
+        # the number of enrollments instead of students x courses
+        for student_id in sorted(self.students):
+            yield student_id, sorted(self.students[student_id].courses.items())
+
+    def display_actual_results(self, writer=None, sparse=False): #this displays the results and the summary
         #i have called quite a few methods to calculate the actual
-        #scores
-        course_ids = sorted(self.courses.keys())
-        student_ids = sorted(self.students.keys())
-        print('RESULTS')
-        print('student_id'.ljust(15), ', '.join([id.ljust(10) for id in course_ids])) #string manipulation to ensure good formatting
-        for student_id in student_ids:
-            scores = [str(self.students[student_id].courses.get(course_id, '')).ljust(10) for course_id in course_ids]
-            print(student_id.ljust(15), ', '.join(scores))
-        print('\nRESULTS SUMMARY')
-        print('There are', len(self.students), 'students and', len(self.courses), 'courses.') #this is the basic credit level requirements 
+        #scores. sparse=True lists one (student, course, score) row per enrollment instead of the students x courses
+        #grid, which is much smaller when students only take a few courses out of many
+        own_writer = writer is None
+        writer = writer or ReportWriter()
+        writer.heading('RESULTS')
+        if sparse:
+            rows = ((student_id, course_id, score) for student_id, scores in self.iter_result_rows() for course_id, score in scores)
+            writer.table('RESULTS', ['student_id', 'course_id', 'score'], rows, '{:<15} {:<10} {}', '{:<15} {:<10} {}')
+        else:
+            course_ids = sorted(self.courses.keys())
+            student_ids = sorted(self.students.keys())
+            columns = {course_id: column for column, course_id in enumerate(course_ids)}
+
+            def rows():
+                # the cell values for a csv or json report, only the courses a student takes are filled in
+                for student_id in student_ids:
+                    row = [''] * len(course_ids)
+                    for course_id, score in self.students[student_id].courses.items():
+                        row[columns[course_id]] = score
+                    yield (student_id, *row)
+
+            def lines():
+                # the text rows, every row starts as a copy of the padded blank cells and only the enrolled courses
+                # are turned into strings, so a row costs one join however many courses there are
+                blank_cells = [''.ljust(10)] * len(course_ids)
+                for student_id in student_ids:
+                    cells = blank_cells.copy()
+                    for course_id, score in self.students[student_id].courses.items():
+                        cells[columns[course_id]] = str(score).ljust(10)
+                    yield student_id.ljust(15) + ' ' + ', '.join(cells)
+
+            template = '{:<15} ' + ', '.join(['{:<10}'] * len(course_ids))  #string manipulation to ensure good formatting
+            writer.table('RESULTS', ['student_id'] + course_ids, rows(), template, template, lines=lines())
+        writer.heading('RESULTS SUMMARY', gap=True)
+        writer.line(f"There are {len(self.students)} students and {len(self.courses)} courses.") #this is the basic credit level requirements 
+        # the totals are kept up to date by upsert_score and retract_score, count_pass_rate_scores recounts them
+        pass_rate = 100 * self.passed_scores / self.total_scores if self.total_scores > 0 else 0
+        writer.line('The average pass rate is {:.2f}%'.format(pass_rate)) #average pass rate printed out
+        if own_writer:
+            writer.flush()
+
+    def export_results(self, file_name):
+        # writes every enrollment as a 'student_id, course_id, score' line (an empty score for ongoing), the same layout
+        # as the results file, so the export is sparse and can be read back with read_results
+        with open(file_name, 'w') as file:
+            writer = ReportWriter([file])
+            for student_id, scores in self.iter_result_rows():
+                writer.write(''.join([f"{student_id}, {course_id}, {'' if score == '--' else score}\n" for course_id, score in scores]))
+            writer.write_out()
+
+    def count_pass_rate_scores(self):
+        # counts the finished scores and the passed scores over every student, this goes over every score so it is
+        # only meant to check the totals kept by upsert_score and retract_score
         total_scores = 0
         passed_scores = 0
         for student in self.students.values():
@@ -234,71 +1663,174 @@ class Results:
                     total_scores += 1
                     if score >= 49.5:
                         passed_scores += 1
-        pass_rate = 100 * passed_scores / total_scores if total_scores > 0 else 0
-        print('The average pass rate is {:.2f}%'.format(pass_rate)) #average pass rate printed out
-    def display_student_info(self):
+        return total_scores, passed_scores
+
+    def display_student_info(self, writer=None):
         #this prints out all the details of the student includeing WGPA meeting the HD level requirements
-        #the strings are manipulated to ensure good formatting
-        print('---------------------------------------------------------------------------------------------------')
-        print('StudentID'.ljust(10)
-              + 'Name'.ljust(15)
-              + 'Type'.ljust(5)
-              + 'Mode'.ljust(5)
-              + 'GPA(100)'.ljust(9)
-              + 'GPA(4)'.ljust(6)
-              + 'WGPA(4)'.ljust(8)
-              + 'Nfinish'.ljust(8)
-              + 'Nongoing'.ljust(9))
-        print('---------------------------------------------------------------------------------------------------')
+        #the rows are formatted with one template, PG students first and then UG students with a rule in between
+        own_writer = writer is None
+        writer = writer or ReportWriter()
         pg_students = [student for student in self.students.values() if isinstance(student, PostgraduateStudent)] #calling the postgraduate student and undergrad student classes
         ug_students = [student for student in self.students.values() if isinstance(student, UndergraduateStudent)]
-        for student in pg_students:
-            print(student.id.ljust(10)
-                  + student.name.ljust(15)
-                  + 'PG'.ljust(5)
-                  + student.mode.ljust(5)
-                  + '{:.2f}'.format(student.average_score_100()).ljust(9)
-                  + '{:.2f}'.format(student.average_score_4()).ljust(6)
-                  + '{:.2f}'.format(student.weighted_gpa_4(self.courses)).ljust(8)
-                  + str(student.number_courses_finished()).ljust(8)
-                  + str(student.number_courses_ongoing()).ljust(9))
-        print('---------------------------------------------------------------------------------------------------')
-        for student in ug_students:
-            print(student.id.ljust(10)
-                  + student.name.ljust(15)
-                  + 'UG'.ljust(5)
-                  + 'FT'.ljust(5)
-                  + '{:.2f}'.format(student.average_score_100()).ljust(9)
-                  + '{:.2f}'.format(student.average_score_4()).ljust(6)
-                  + '{:.2f}'.format(student.weighted_gpa_4(self.courses)).ljust(8)
-                  + str(student.number_courses_finished()).ljust(8)
-                  + str(student.number_courses_ongoing()).ljust(9))
-    def display_student_summary(self):
-        print('\nSTUDENT SUMMARY') #this prints out the best ug and pg student scores
-        #this is for prrinting out the best student with the best wgpa score
-        pg_students = [student for student in self.students.values() if isinstance(student, PostgraduateStudent)]
-        ug_students = [student for student in self.students.values() if isinstance(student, UndergraduateStudent)]        
-        if pg_students:
-            best_pg_student = max(pg_students, key=lambda student: student.weighted_gpa_4(self.courses))
-            print(f"The best PG student is {best_pg_student.id} with a WGPA score of {best_pg_student.weighted_gpa_4(self.courses):.2f}.")        
-        if ug_students:
-            best_ug_student = max(ug_students, key=lambda student: student.weighted_gpa_4(self.courses))
-            print(f"The best UG student is {best_ug_student.id} with a WGPA score of {best_ug_student.weighted_gpa_4(self.courses):.2f}.")
-def custom_print(*args, **kwargs): #this was to write into the reports.txt file which is challenging and is still not working
-    #apologies for the inconvenience in the code, it was initially working which is why I have kept the code block and moved to the next distinction level as I thought this was working
-    kwargs.pop('file', None) 
-    print(*args, file=report_file, **kwargs)
+
+        def student_row(student, student_type, mode):
+            metrics = student.student_metrics(self.courses)  # every metric of the student in one (cached) pass
+            return (student.id, student.name, student_type, mode, metrics['gpa_100'], metrics['gpa_4'], metrics['wgpa_4'],
+                    metrics['finished'], metrics['ongoing'])
+
+        rows = chain((student_row(student, 'PG', student.mode) for student in pg_students), [None],
+                     (student_row(student, 'UG', 'FT') for student in ug_students))
+        writer.table('STUDENT INFORMATION', ['StudentID', 'Name', 'Type', 'Mode', 'GPA(100)', 'GPA(4)', 'WGPA(4)', 'Nfinish', 'Nongoing'], rows,
+                     '{:<10}{:<15}{:<5}{:<5}{:<9}{:<6}{:<8}{:<8}{:<9}',
+                     '{:<10}{:<15}{:<5}{:<5}{:<9.2f}{:<6.2f}{:<8.2f}{:<8}{:<9}', rule=REPORT_RULE)
+        if own_writer:
+            writer.flush()
+
+    def display_student_summary(self, writer=None):
+        own_writer = writer is None
+        writer = writer or ReportWriter()
+        writer.heading('STUDENT SUMMARY', gap=True) #this prints out the best ug and pg student scores
+        for student_id, wgpa in self.top_students(1, 'PG'):
+            writer.line(f"The best PG student is {student_id} with a WGPA score of {wgpa:.2f}.")
+        for student_id, wgpa in self.top_students(1, 'UG'):
+            writer.line(f"The best UG student is {student_id} with a WGPA score of {wgpa:.2f}.")
+        if own_writer:
+            writer.flush()
+
+
+def load_results(courses_file, students_file, results_files, workers=None, compact=False, columnar=False, error_policy='abort'):
+    # a new Results with the courses, the students and every results file loaded, used by the query server and the
+    # benchmark suite. run_batch loads the same way but times every file on its own
+    results = Results(compact, columnar)
+    results.read_courses(courses_file)
+    results.read_students(students_file)
+    results.read_results_files(results_files, workers, error_policy)
+    return results
+
+
+def max_rss():
+    # the most memory the process has held so far in bytes, or None without the resource module (Windows)
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024  # macOS counts bytes, Linux kilobytes
+
+
+class PhaseTimer:  # times the phases of a batch run, with the peak RSS of the process after each one
+    # the wall times are only comparable between runs while nothing else slows the phases down, so tracing the Python
+    # memory of every phase with tracemalloc (track_memory, several times slower) is kept apart from plain timings
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.phases = []  # (name, seconds, max RSS bytes or None, traced peak bytes or None) for every phase in the order they ran
+
+    def run(self, name, function, *args):
+        # runs function(*args) as one phase and returns what it returns
+        if self.track_memory:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - started
+        self.phases.append((name, seconds, max_rss(), tracemalloc.get_traced_memory()[1] if self.track_memory else None))
+        return result
+
+    def report(self, file):
+        # Max RSS is the high-water mark of the whole process so far (without worker processes), Traced MB the peak
+        # of the Python objects allocated during the phase
+        file.write('Phase'.ljust(30) + 'Seconds'.rjust(10) + ('Max RSS MB'.rjust(12) if resource else '')
+                   + ('Traced MB'.rjust(11) if self.track_memory else '') + '\n')
+        for name, seconds, rss, traced in self.phases:
+            file.write(name.ljust(30) + f'{seconds:10.3f}' + ('' if rss is None else f'{rss / 2 ** 20:12.1f}')
+                       + ('' if traced is None else f'{traced / 2 ** 20:11.1f}') + '\n')
+        file.write('total'.ljust(30) + f'{sum(phase[1] for phase in self.phases):10.3f}\n')
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog='python -m ScholaFlex', description='Loads the course, student and result files and writes every report without asking for anything.')
+    parser.add_argument('courses', help='the courses file')
+    parser.add_argument('students', help='the students file')
+    parser.add_argument('results', nargs='+', help='one or more results files, several files are read in parallel')
+    parser.add_argument('--format', choices=REPORT_FORMATS, default='text', help='the report format (default: text)')
+    parser.add_argument('--report', metavar='FILE', help='also write the report to FILE, e.g. reports.txt')
+    parser.add_argument('--sparse', action='store_true', help='list the results one enrollment per row instead of as a grid')
+    parser.add_argument('--workers', type=int, help='the number of processes used to read several results files (default: one per CPU)')
+    parser.add_argument('--compact', action='store_true', help='keep the scores in compact arrays, slower to load but uses less memory')
+    parser.add_argument('--columnar', action='store_true', help='keep every score in one columnar store and work out the metrics in one vectorized pass (needs numpy)')
+    parser.add_argument('--error-policy', choices=ERROR_POLICIES, default='abort', help='what to do with a bad result row, abort stops the load and exits with status 1 without writing a report (default: abort)')
+    parser.add_argument('--timings', action='store_true', help='print the time of every phase and the peak RSS of the process to stderr')
+    parser.add_argument('--memory', action='store_true', help='also trace the peak Python memory of every phase with tracemalloc (several times slower, so the times are not comparable with a --timings run)')
+    parser.add_argument('--profile', action='store_true', help='run under cProfile and print the busiest functions to stderr')
+    return parser.parse_args(argv)
+
+
+def run_batch(arguments, timer):
+    # loads everything and writes the same report as main, every phase is run through the timer. The load messages go
+    # to stderr so a csv or json report on stdout stays clean
+    results = Results(arguments.compact, arguments.columnar)
+    with contextlib.redirect_stdout(sys.stderr):
+        timer.run('load courses', results.read_courses, arguments.courses)
+        timer.run('load students', results.read_students, arguments.students)
+        timer.run('load results', results.read_results_files, arguments.results, arguments.workers, arguments.error_policy)
+    aborted = [stats.file_name for stats in results.load_stats if stats.aborted]
+    if aborted:
+        # a load stopped at a bad row leaves the rest of the file out, so no report is written from it
+        raise ValueError(f"Error: loading {', '.join(aborted)} stopped at a bad row (--error-policy abort), no report was written.")
+    timer.run('compute metrics', results.compute_all_metrics)
+    report_file = open(arguments.report, 'w') if arguments.report else None
+    try:
+        writer = ReportWriter([sys.stdout] + ([report_file] if report_file else []), arguments.format)
+        writer.heading('COURSE INFORMATION')
+        timer.run('render course info', results.display_course_info, writer)
+        timer.run('render course summary', results.display_course_summary, writer)
+        writer.heading('STUDENT INFORMATION', gap=True)
+        timer.run('render student info', results.display_student_info, writer)
+        timer.run('render student summary', results.display_student_summary, writer)
+        timer.run('render results', results.display_actual_results, writer, arguments.sparse)
+        timer.run('render final course summary', results.display_course_summary, writer)
+        timer.run('write report', writer.flush)
+    finally:
+        if report_file:
+            report_file.close()
+    return results
+
+
+def cli(argv=None):
+    # the non-interactive entry point, e.g. python -m ScholaFlex courses.txt students.txt results.txt --timings
+    arguments = parse_arguments(sys.argv[1:] if argv is None else argv)
+    timer = PhaseTimer(track_memory=arguments.memory)
+    profiler = cProfile.Profile() if arguments.profile else None
+    if arguments.memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        run_batch(arguments, timer)
+    except (FileNotFoundError, ImportError, ValueError) as error:
+        message = str(error)
+        print(message if message.startswith('Error') else f"Error: {message}", file=sys.stderr)
+        return 1
+    finally:
+        if profiler:
+            profiler.disable()
+        if arguments.memory:
+            tracemalloc.stop()
+    if arguments.timings or arguments.memory:
+        timer.report(sys.stderr)
+    if profiler:
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+    return 0
+
+
 def main():
     print("Name: Amay Viswanathan Iyer")
     print("Student ID: s3970066")
     print("Highest Level Attempted: HD")
-    print("Notes: the reports.txt does not correctly write the outputs.")
+    print("Notes: the tables are written to reports.txt as well as shown here.")
     print("Additional Notes: enter the valid courses, students, and results file names and all the necessary tables will be output.")
     print("")
     try: #all of the input validation and file reading occurs between this main method and the read file functions
         #the user is prompted persistently until a valid file name is entered
-        global report_file
-        report_file = open('reports.txt', 'w') #this code block does not correctly write the outputs
+        report_file = open('reports.txt', 'w')
+        writer = ReportWriter([sys.stdout, report_file])  # the report is built once and written to the screen and reports.txt together
         results = Results()
         while True:
             try:
@@ -331,12 +1863,15 @@ def main():
                 break
             except FileNotFoundError:
                 print(f"The file {results_file} was not found. Please check the results file name and try again.")
-        results.display_results()
-        results.display_actual_results()
-        results.display_course_summary()
+        results.compute_all_metrics()
+        results.display_results(writer)
+        results.display_actual_results(writer)
+        results.display_course_summary(writer)
+        writer.flush()
     except Exception as e:
         print(f"An unexpected error occurred: {e}") #this occurs when a correct file is entered but the file is unable to be read by the program
     finally:
         report_file.close()
 if __name__ == '__main__':
-    main()
+    # with file names on the command line the batch mode runs, otherwise the file names are asked for
+    sys.exit(cli() if len(sys.argv) > 1 else main())
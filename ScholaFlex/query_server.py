@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import json
+from urllib.parse import unquote
+
+from .my_school import LoadStats, check_result_ids, load_results, parse_result_row, stream_rows
+
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict'}
+
+
+def student_entry(student, courses):
+    # everything the server answers about one student, worked out once when a snapshot is built
+    metrics = student.student_metrics(courses)
+    return {
+        'id': student.id,
+        'name': student.name.strip(),
+        'type': student.student_type,
+        'mode': student.mode or 'FT',  # UG students are always FT
+        'courses': dict(student.courses),
+        'gpa_100': metrics['gpa_100'],
+        'gpa_4': metrics['gpa_4'],
+        'wgpa_4': metrics['wgpa_4'],
+        'finished': metrics['finished'],
+        'ongoing': metrics['ongoing'],
+        'min_courses': student.min_courses,
+        'satisfies_enrollment': student.satisfies_enrollment(),
+    }
+
+
+def course_entry(course):
+    return {
+        'id': course.id,
+        'name': course.name.strip(),
+        'credit': course.credit,
+        'semester': course.semester,
+        'average': course.average_score(),
+        'finished': course.students_finished,
+        'ongoing': course.students_ongoing,
+    }
+
+
+class QuerySnapshot:  # a frozen copy of everything the server answers, it is never changed once built
+    # a reader takes the current snapshot once per request, so it never sees half of a reload or correction batch
+    def __init__(self, version, students, courses, total_scores, passed_scores):
+        self.version = version
+        self.students = students  # student ID -> student_entry
+        self.courses = courses  # course ID -> course_entry
+        self.total_scores = total_scores
+        self.passed_scores = passed_scores
+
+    @classmethod
+    def from_results(cls, results, version, previous=None, changed_students=(), changed_courses=()):
+        # builds a snapshot of results. With a previous snapshot only the changed students and courses are worked out
+        # again, the rest of the entries are shared with it (they are never changed, so sharing them is safe)
+        if previous is None:
+            students = {student_id: student_entry(student, results.courses) for student_id, student in results.students.items()}
+            courses = {course_id: course_entry(course) for course_id, course in results.courses.items()}
+        else:
+            students = previous.students.copy()
+            courses = previous.courses.copy()
+            for student_id in changed_students:
+                students[student_id] = student_entry(results.students[student_id], results.courses)
+            for course_id in changed_courses:
+                courses[course_id] = course_entry(results.courses[course_id])
+        return cls(version, students, courses, results.total_scores, results.passed_scores)
+
+    def pass_rate(self):
+        # the same pass rate as display_actual_results
+        return 100 * self.passed_scores / self.total_scores if self.total_scores > 0 else 0
+
+
+def check_corrections(results, file_name=None, upserts=(), retractions=()):
+    # checks a correction batch against results without changing anything: the rows of a results-layout file and / or
+    # a list of [student_id, course_id, score] upserts ('' or '--' for ongoing) and [student_id, course_id] retractions.
+    # Every row is parsed and its IDs are looked up here, a bad one is reported and left out. The checked
+    # (student_id, course_id, score) upserts and (student_id, course_id) retractions are returned for apply_corrections
+    checked_upserts, checked_retractions = [], []
+
+    def add_upsert(row):
+        student_id, course_id, score = parse_result_row(row)
+        check_result_ids(student_id, course_id, results.students, results.courses)
+        checked_upserts.append((student_id, course_id, score))
+
+    if file_name:
+        # the stats of a batch are only reported, they are not kept in results.load_stats like the ones of a load
+        stream_rows(file_name, add_upsert, LoadStats(file_name, 'skip')).report()
+    for item in upserts:
+        try:
+            student_id, course_id, score = item
+            if not isinstance(student_id, str) or not isinstance(course_id, str):
+                raise TypeError
+        except (TypeError, ValueError):
+            print(f"Error: Invalid upsert {item}. An upsert is [student_id, course_id, score]. Skipping this correction.")
+            continue
+        try:
+            add_upsert([student_id, course_id, '' if score in ('--', None) else str(score)])
+        except ValueError as error:
+            print(error, 'Skipping this correction.')
+    for item in retractions:
+        try:
+            student_id, course_id = item
+            check_result_ids(student_id, course_id, results.students, results.courses)
+        except (TypeError, ValueError):
+            print(f"Error: Invalid retraction {item}. A retraction is [student_id, course_id] of a known student and course. Skipping this correction.")
+            continue
+        checked_retractions.append((student_id, course_id))
+    return checked_upserts, checked_retractions
+
+
+def apply_corrections(results, upserts, retractions, changed_students, changed_courses):
+    # applies the upserts and retractions returned by check_corrections. The IDs of the students and courses that
+    # change are added to changed_students and changed_courses as it goes, so they are known even if it stops halfway.
+    # A retraction of an enrollment the student does not have (e.g. retracted twice) is skipped
+    for student_id, course_id, score in upserts:
+        results.upsert_score(student_id, course_id, score)
+        changed_students.add(student_id)
+        changed_courses.add(course_id)
+    for student_id, course_id in retractions:
+        try:
+            results.retract_score(student_id, course_id)
+        except ValueError as error:
+            print(error, 'Skipping this correction.')
+            continue
+        changed_students.add(student_id)
+        changed_courses.add(course_id)
+
+
+class QueryServer:  # answers lookups over HTTP on localhost from the current QuerySnapshot
+    # GET  /students/ID             the transcript and every metric of a student
+    # GET  /students/ID/wgpa        the weighted GPA of a student
+    # GET  /students/ID/enrollment  whether the student satisfies the enrollment requirement
+    # GET  /courses/ID              the average score and counters of a course
+    # GET  /pass-rate               the pass rate of display_actual_results
+    # GET  /status                  the snapshot version and whether a new one is being built
+    # POST /reload                  {"courses": file, "students": file, "results": [files]} loads everything again
+    # POST /corrections             {"file": file, "upserts": [[student, course, score]], "retractions": [[student, course]]}
+    #                               the whole batch is checked before anything is applied, bad items are skipped
+    # The two POSTs build the next snapshot in a background thread while reads carry on from the current one, then
+    # swap it in with one assignment. Only one build runs at a time, a second POST meanwhile gets 409
+    def __init__(self, results):
+        self.results = results  # the master copy, only ever changed by the build running in the background
+        self.snapshot = QuerySnapshot.from_results(results, 1)
+        self.build = None  # the background build task, if one is running
+        self.last_error = None
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        # starts listening, port 0 picks a free port which is then in self.port
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def handle(self, reader, writer):
+        # one HTTP/1.1 connection, requests are answered in turn until the client closes it
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    body = await reader.readexactly(int(headers.get('content-length', 0)))
+                    method, target, _ = request_line.decode('latin-1').split()
+                    status, payload = self.answer(method, unquote(target.split('?')[0]), body)
+                except (ValueError, KeyError, TypeError) as error:  # a malformed request or a POST body missing a field
+                    status, payload = 400, {'error': f"Bad request: {error}"}
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def answer(self, method, path, body):
+        # returns (status, payload) for one request
+        snapshot = self.snapshot  # one snapshot for the whole request
+        parts = [part for part in path.split('/') if part]
+        if method == 'POST':
+            return self.start_build(parts, json.loads(body or b'{}'))
+        if method != 'GET':
+            return 405, {'error': f"{method} is not supported."}
+        if parts == ['pass-rate']:
+            return 200, {'pass_rate': snapshot.pass_rate(), 'total_scores': snapshot.total_scores, 'passed_scores': snapshot.passed_scores, 'version': snapshot.version}
+        if parts == ['status']:
+            return 200, {'version': snapshot.version, 'students': len(snapshot.students), 'courses': len(snapshot.courses),
+                         'building': self.build is not None, 'last_error': self.last_error}
+        if len(parts) == 2 and parts[0] == 'courses':
+            course = snapshot.courses.get(parts[1])
+            return (200, course) if course else (404, {'error': f"Unknown course ID {parts[1]}."})
+        if len(parts) in (2, 3) and parts[0] == 'students':
+            student = snapshot.students.get(parts[1])
+            if student is None:
+                return 404, {'error': f"Unknown student ID {parts[1]}."}
+            if len(parts) == 2:
+                return 200, student
+            if parts[2] == 'wgpa':
+                return 200, {'id': student['id'], 'wgpa_4': student['wgpa_4']}
+            if parts[2] == 'enrollment':
+                return 200, {'id': student['id'], 'courses': len(student['courses']), 'min_courses': student['min_courses'],
+                             'satisfies_enrollment': student['satisfies_enrollment']}
+        return 404, {'error': f"Unknown path {path}."}
+
+    def start_build(self, parts, request):
+        if parts not in (['reload'], ['corrections']):
+            return 404, {'error': f"Unknown path /{'/'.join(parts)}."}
+        if not isinstance(request, dict):
+            return 400, {'error': 'Bad request: the body must be a JSON object.'}
+        if self.build is not None:
+            return 409, {'error': 'A snapshot is already being built, try again when it is done.'}
+        if parts == ['reload']:
+            courses_file, students_file, results_files = request['courses'], request['students'], request['results']
+            workers = request.get('workers')
+            if not (isinstance(courses_file, str) and isinstance(students_file, str) and isinstance(results_files, list)
+                    and all(isinstance(file_name, str) for file_name in results_files) and (workers is None or type(workers) is int and workers > 0)):
+                return 400, {'error': 'Bad request: courses and students must be file names, results a list of file names and workers a positive number.'}
+            build = self.reload(courses_file, students_file, results_files, workers)
+        else:
+            file_name, upserts, retractions = request.get('file'), request.get('upserts', []), request.get('retractions', [])
+            if not (file_name is None or isinstance(file_name, str)) or not isinstance(upserts, list) or not isinstance(retractions, list):
+                return 400, {'error': 'Bad request: file must be a file name and upserts and retractions lists.'}
+            build = self.correct(file_name, upserts, retractions)
+        self.build = asyncio.get_running_loop().create_task(build)
+        return 202, {'building': self.snapshot.version + 1}
+
+    async def reload(self, courses_file, students_file, results_files, workers=None):
+        # loads everything again into a new Results and swaps a snapshot of it in
+        await self.run_build(self.build_reload, courses_file, students_file, results_files, workers)
+
+    async def correct(self, file_name=None, upserts=(), retractions=()):
+        # applies a correction batch to the master copy and swaps in a snapshot sharing every unchanged entry
+        await self.run_build(self.build_corrections, file_name, upserts, retractions)
+
+    async def run_build(self, build, *args):
+        try:
+            snapshot = await asyncio.to_thread(build, *args)
+            self.snapshot = snapshot  # the swap, readers take either the old or the new snapshot
+            self.last_error = None
+        except Exception as error:  # the build runs in the background, so no error may get lost in the task
+            self.last_error = str(error) or type(error).__name__  # the current snapshot (or the one a half applied batch published) stays in place
+        finally:
+            self.build = None
+
+    def build_reload(self, courses_file, students_file, results_files, workers):
+        results = load_results(courses_file, students_file, results_files, workers, self.results.compact, self.results.score_store is not None)
+        snapshot = QuerySnapshot.from_results(results, self.snapshot.version + 1)
+        self.results = results
+        return snapshot
+
+    def build_corrections(self, file_name, upserts, retractions):
+        # the whole batch is checked before the master copy is touched, so a bad row or a missing file changes nothing
+        upserts, retractions = check_corrections(self.results, file_name, upserts, retractions)
+        changed_students, changed_courses = set(), set()
+        try:
+            apply_corrections(self.results, upserts, retractions, changed_students, changed_courses)
+        except BaseException:
+            # what was applied is in the master copy already, so it is published before the error is passed on,
+            # otherwise the next batch would publish counters that include it next to students that do not
+            self.snapshot = QuerySnapshot.from_results(self.results, self.snapshot.version + 1, self.snapshot, changed_students, changed_courses)
+            raise
+        return QuerySnapshot.from_results(self.results, self.snapshot.version + 1, self.snapshot, changed_students, changed_courses)
+
+
+async def serve(results, host, port):
+    query_server = QueryServer(results)
+    server = await query_server.start(host, port)
+    print(f"Serving {len(results.students)} students and {len(results.courses)} courses on http://{host}:{query_server.port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m ScholaFlex.query_server', description='Keeps the results loaded and answers lookups over HTTP.')
+    parser.add_argument('courses', help='the courses file')
+    parser.add_argument('students', help='the students file')
+    parser.add_argument('results', nargs='+', help='one or more results files')
+    parser.add_argument('--host', default='127.0.0.1', help='the address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='the port to listen on (default: 8080)')
+    parser.add_argument('--workers', type=int, help='the processes used to read several results files')
+    parser.add_argument('--compact', action='store_true', help='keep the scores in compact arrays to use less memory')
+    parser.add_argument('--columnar', action='store_true', help='keep every score in one columnar store (needs numpy)')
+    arguments = parser.parse_args()
+    results = load_results(arguments.courses, arguments.students, arguments.results, arguments.workers, arguments.compact, arguments.columnar)
+    try:
+        asyncio.run(serve(results, arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import os
+import random
+
+COURSE_PREFIXES = ('COSC', 'ISYS', 'MATH')  # the only course ID prefixes read_results accepts
+COURSE_NAMES = ('Java', 'Data', 'Computing', 'System', 'Analytics', 'Networks', 'Security', 'Algebra', 'Statistics', 'Design')
+STUDENT_NAMES = ('Jack', 'Sarah', 'Liam', 'Charlie', 'Sophia', 'Alex', 'Mia', 'Noah', 'Olivia', 'Ethan')
+CREDITS = (6, 12, 24)
+SEMESTERS = ('Sem1', 'Sem2')
+
+
+def dataset_files(directory, shards=1):
+    # the (courses file, students file, [results files]) generate_dataset writes into directory
+    results_files = [os.path.join(directory, 'results.txt')] if shards == 1 else \
+        [os.path.join(directory, f'results_{shard}.txt') for shard in range(shards)]
+    return os.path.join(directory, 'courses.txt'), os.path.join(directory, 'students.txt'), results_files
+
+
+def generate_dataset(directory, students=1000, courses=200, courses_per_student=4, pg_fraction=0.5, pt_fraction=0.5,
+                     elective_fraction=0.4, ongoing_fraction=0.1, shards=1, seed=0):
+    # writes courses.txt, students.txt and results.txt (or results_0.txt ... when shards > 1) in the same layout as the
+    # sample files, so every row can be read by Results. The same arguments and seed always give the same files.
+    #   pg_fraction        the share of postgraduate students, the rest are undergraduates
+    #   pt_fraction        the share of postgraduate students studying part time
+    #   elective_fraction  the share of elective courses, the rest are core courses
+    #   ongoing_fraction   the share of results that are still '--'
+    # every student gets courses_per_student different courses, so there are students x courses_per_student results.
+    # The file names are returned as (courses file, students file, [results files])
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    courses_file, students_file, results_files = dataset_files(directory, shards)
+    digits = max(3, len(str(courses - 1)))
+    course_ids = [f"{COURSE_PREFIXES[number % 3]}{number:0{digits}d}" for number in range(courses)]
+    student_ids = [f"S{number:0{max(3, len(str(students - 1)))}d}" for number in range(students)]
+
+    with open(courses_file, 'w') as file:
+        for course_id in course_ids:
+            name, credit = rng.choice(COURSE_NAMES), rng.choice(CREDITS)
+            if rng.random() < elective_fraction:
+                file.write(f"{course_id}, E, {name}, {credit}, {rng.choice(SEMESTERS)}\n")
+            else:
+                file.write(f"{course_id}, C, {name}, {credit}\n")
+
+    with open(students_file, 'w') as file:
+        for student_id in student_ids:
+            name = rng.choice(STUDENT_NAMES)
+            if rng.random() < pg_fraction:
+                file.write(f"{student_id}, {name}, PG, {'PT' if rng.random() < pt_fraction else 'FT'}\n")
+            else:
+                file.write(f"{student_id}, {name}, UG\n")
+
+    # the students are dealt out to the shards in blocks, like one results file per faculty
+    per_shard = -(-students // shards)  # rounding up
+    courses_per_student = min(courses_per_student, courses)
+    for shard, results_file in enumerate(results_files):
+        with open(results_file, 'w') as file:
+            lines = []
+            for student_id in student_ids[shard * per_shard:(shard + 1) * per_shard]:
+                for course_id in rng.sample(course_ids, courses_per_student):
+                    score = '' if rng.random() < ongoing_fraction else f"{rng.uniform(20, 100):.1f}"
+                    lines.append(f"{student_id}, {course_id}, {score}\n")
+                if len(lines) >= 10000:  # written in batches so a big file never sits in memory
+                    file.write(''.join(lines))
+                    lines = []
+            file.write(''.join(lines))
+    return courses_file, students_file, results_files
+
+
+def add_mix_arguments(parser):
+    # the dataset options, shared with the benchmark
+    parser.add_argument('--courses', type=int, default=200, help='the number of courses (default: 200)')
+    parser.add_argument('--courses-per-student', type=int, default=4, help='the courses every student takes (default: 4)')
+    parser.add_argument('--pg-fraction', type=float, default=0.5, help='the share of PG students (default: 0.5)')
+    parser.add_argument('--pt-fraction', type=float, default=0.5, help='the share of PG students studying part time (default: 0.5)')
+    parser.add_argument('--elective-fraction', type=float, default=0.4, help='the share of elective courses (default: 0.4)')
+    parser.add_argument('--ongoing-fraction', type=float, default=0.1, help="the share of '--' results (default: 0.1)")
+    parser.add_argument('--shards', type=int, default=1, help='the number of results files (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed (default: 0)')
+
+
+def mix_options(arguments):
+    return {'courses': arguments.courses, 'courses_per_student': arguments.courses_per_student,
+            'pg_fraction': arguments.pg_fraction, 'pt_fraction': arguments.pt_fraction,
+            'elective_fraction': arguments.elective_fraction, 'ongoing_fraction': arguments.ongoing_fraction,
+            'shards': arguments.shards, 'seed': arguments.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m ScholaFlex.synthetic_data', description='Writes a synthetic courses, students and results data set.')
+    parser.add_argument('directory', help='where the files are written')
+    parser.add_argument('--students', type=int, default=1000, help='the number of students (default: 1000)')
+    add_mix_arguments(parser)
+    arguments = parser.parse_args()
+    courses_file, students_file, results_files = generate_dataset(arguments.directory, arguments.students, **mix_options(arguments))
+    print('Wrote', courses_file, students_file, ' '.join(results_files))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import pickle
+import unittest
+
+from ScholaFlex.my_school import CompactScores
+
+
+class CompactScoresTest(unittest.TestCase):
+    def test_reads_and_writes_like_a_dict(self):
+        expected = {'COSC045': 40.0, 'ISYS089': '--', 'MATH346': 0.0}
+        scores = CompactScores(expected)
+        self.assertEqual(dict(scores), expected)
+        self.assertEqual(list(scores), list(expected))
+        self.assertEqual((len(scores), scores['ISYS089'], scores.get('BIOL001')), (3, '--', None))
+        self.assertNotIn('COSC123', scores)
+
+        scores['ISYS089'] = 75.5  # an ongoing course that got its mark keeps its place
+        scores['COSC045'] = '--'
+        scores['COSC123'] = 49.5
+        del scores['MATH346']
+        self.assertEqual(list(scores.items()), [('COSC045', '--'), ('ISYS089', 75.5), ('COSC123', 49.5)])
+        with self.assertRaises(KeyError):
+            scores['MATH346']
+        with self.assertRaises(KeyError):
+            del scores['MATH346']
+        self.assertEqual(scores.pop('COSC123'), 49.5)
+        self.assertEqual(len(scores), 2)
+
+    def test_students_share_the_course_numbers(self):
+        first, second = CompactScores({'COSC045': 10.0}), CompactScores({'ISYS273': 20.0, 'COSC045': '--'})
+        self.assertEqual(CompactScores.course_number('COSC045'), CompactScores.course_number('COSC045'))
+        self.assertEqual(len(second.pairs), 4)  # one (course number, score) pair per enrollment
+        self.assertEqual((first['COSC045'], second['COSC045']), (10.0, '--'))
+
+    def test_pickle_carries_the_course_ids(self):
+        scores = CompactScores({'COSC045': 91.0, 'ISYS089': '--'})
+        copy = pickle.loads(pickle.dumps(scores))
+        self.assertIs(type(copy), CompactScores)
+        self.assertEqual(list(copy.items()), list(scores.items()))
+        self.assertEqual(pickle.loads(pickle.dumps(CompactScores())), CompactScores())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from ScholaFlex.my_school import Results, cli
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ScholaFlex')
+
+
+class LoadingTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def read_results(self, text, error_policy='skip'):
+        # loads the sample courses and students and text as the results file
+        file_name = os.path.join(self.directory.name, 'results.txt')
+        with open(file_name, 'w') as file:
+            file.write(text)
+        results = Results()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results.read_courses(os.path.join(DATA, 'courses.txt'))
+            results.read_students(os.path.join(DATA, 'students.txt'))
+            stats = results.read_results(file_name, error_policy)
+        return results, stats
+
+    def test_a_stray_quote_stays_in_its_row(self):
+        results, stats = self.read_results('S001, COSC045,"40\nS001, ISYS089, 70\nS012,"COSC123, 50\nS012, ISYS273, 60\n')
+        self.assertEqual((stats.rows, stats.rejected), (4, 2))
+        self.assertEqual(dict(results.students['S001'].courses), {'ISYS089': 70.0})
+        self.assertEqual(dict(results.students['S012'].courses), {'ISYS273': 60.0})
+
+    def test_a_huge_line_is_one_rejected_row(self):
+        results, stats = self.read_results('S001, COSC045, 40\nS001, ISYS089, ' + '9' * 200000 + 'x\r\nS012, COSC123, 50\r\n')
+        self.assertEqual((stats.rows, stats.rejected, stats.aborted), (3, 1, False))
+        self.assertEqual(results.count_pass_rate_scores(), (2, 1))
+
+        results, stats = self.read_results('S001, COSC045, 40\nS001, ISYS089, "' + 'x' * 200000 + '\nS012, COSC123, 50\n', 'abort')
+        self.assertEqual((stats.rows, stats.rejected, stats.aborted), (2, 1, True))
+        self.assertEqual(results.count_pass_rate_scores(), (1, 0))
+
+    def test_quarantine_keeps_the_lines_as_read(self):
+        text = 'S001, COSC045, "40\n\nS001, BIOL001, 70\nS012, COSC123, 50\n'
+        results, stats = self.read_results(text, 'quarantine')
+        self.assertEqual((stats.rows, stats.rejected), (3, 2))
+        with open(stats.quarantine_file) as file:
+            self.assertEqual(file.read(), 'S001, COSC045, "40\nS001, BIOL001, 70\n')
+
+    def test_an_aborted_load_writes_no_report(self):
+        bad = os.path.join(self.directory.name, 'bad.txt')
+        with open(bad, 'w') as file:
+            file.write('S001, COSC045, 40\nS001, ISYS089, abc\nS012, COSC123, 50\n')
+        courses, students, good = (os.path.join(DATA, name) for name in ('courses.txt', 'students.txt', 'results.txt'))
+        for results_files in ([bad], [good, bad]):
+            for error_policy, status in (('abort', 1), ('skip', 0)):
+                with self.subTest(files=len(results_files), error_policy=error_policy):
+                    report, messages = io.StringIO(), io.StringIO()
+                    with contextlib.redirect_stdout(report), contextlib.redirect_stderr(messages):
+                        code = cli([courses, students, *results_files, '--workers', '1', '--error-policy', error_policy])
+                    self.assertEqual(code, status)
+                    self.assertEqual(report.getvalue() == '', status == 1)
+                    if status:
+                        self.assertIn(f'loading {bad} stopped at a bad row', messages.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
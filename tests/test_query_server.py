@@ -0,0 +1,192 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from ScholaFlex.query_server import QueryServer, load_results
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ScholaFlex')
+
+
+def load_sample():
+    # the sample courses, students and results files of the repository
+    with contextlib.redirect_stdout(io.StringIO()):
+        return load_results(os.path.join(DATA, 'courses.txt'), os.path.join(DATA, 'students.txt'), [os.path.join(DATA, 'results.txt')])
+
+
+async def request(port, method, path, body=None):
+    # sends one request on its own connection to the server on localhost and returns (status, json payload)
+    data = b'' if body is None else body if isinstance(body, bytes) else json.dumps(body).encode()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    payload = json.loads(await reader.readexactly(int(headers['content-length'])))
+    writer.close()
+    await writer.wait_closed()
+    return status, payload
+
+
+class QueryServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.results = load_sample()
+        self.query_server = QueryServer(self.results)
+        await self.query_server.start('127.0.0.1', 0)
+        self.port = self.query_server.port
+
+    async def asyncTearDown(self):
+        self.query_server.server.close()
+        await self.query_server.server.wait_closed()
+
+    async def get(self, path):
+        return await request(self.port, 'GET', path)
+
+    async def post(self, path, body):
+        # posts a build and waits for it to finish, the messages of skipped corrections are kept out of the test output
+        with contextlib.redirect_stdout(io.StringIO()):
+            status, payload = await request(self.port, 'POST', path, body)
+            if self.query_server.build is not None:
+                await self.query_server.build
+        return status, payload
+
+    async def test_get_routes(self):
+        student = self.results.students['S034']
+        metrics = student.student_metrics(self.results.courses)
+        status, payload = await self.get('/students/S034')
+        self.assertEqual(status, 200)
+        self.assertEqual(payload['courses'], {'COSC123': 85.7, 'COSC045': '--', 'ISYS089': 89.0, 'ISYS273': 74.5})
+        self.assertEqual((payload['type'], payload['mode'], payload['finished'], payload['ongoing']), ('PG', 'FT', 3, 1))
+        self.assertAlmostEqual(payload['gpa_100'], metrics['gpa_100'])
+
+        status, payload = await self.get('/students/S034/wgpa')
+        self.assertEqual(status, 200)
+        self.assertAlmostEqual(payload['wgpa_4'], student.weighted_gpa_4(self.results.courses))
+
+        status, payload = await self.get('/students/S012/enrollment')
+        self.assertEqual((status, payload), (200, {'id': 'S012', 'courses': 2, 'min_courses': 2, 'satisfies_enrollment': True}))
+
+        status, payload = await self.get('/courses/COSC045')
+        self.assertEqual(status, 200)
+        self.assertEqual((payload['finished'], payload['ongoing']), (3, 1))
+        self.assertAlmostEqual(payload['average'], self.results.courses['COSC045'].average_score())
+
+        status, payload = await self.get('/pass-rate')
+        self.assertEqual(status, 200)
+        self.assertEqual((payload['total_scores'], payload['passed_scores']), self.results.count_pass_rate_scores())
+
+        status, payload = await self.get('/status')
+        self.assertEqual((status, payload), (200, {'version': 1, 'students': 6, 'courses': 5, 'building': False, 'last_error': None}))
+
+        for path in ('/students/S999', '/students/S034/nothing', '/courses/BIOL001', '/nothing'):
+            self.assertEqual((await self.get(path))[0], 404, path)
+        self.assertEqual((await request(self.port, 'DELETE', '/status'))[0], 405)
+
+    async def test_bad_post_bodies(self):
+        for path, body in (('/corrections', b'[1, 2]'), ('/corrections', b'"text"'), ('/corrections', b'not json'),
+                           ('/corrections', {'upserts': 5}), ('/reload', {'courses': 'courses.txt'}),
+                           ('/reload', {'courses': 'courses.txt', 'students': 'students.txt', 'results': 'results.txt'})):
+            status, payload = await self.post(path, body)
+            self.assertEqual(status, 400, body)
+        status, payload = await self.get('/status')
+        self.assertEqual((status, payload['version'], payload['building']), (200, 1, False))
+
+    async def test_partly_bad_batch_is_published_consistently(self):
+        status, payload = await self.post('/corrections', {'upserts': [['S001', 'COSC045', 10], ['S001', 'COSC123'], 7, ['S001', 'BIOL001', 50],
+                                                                       ['S001', 'ISYS089', 'abc']],
+                                                           'retractions': [['S120'], ['S120', 'MATH346'], ['S001', 'MATH346']]})
+        self.assertEqual((status, payload), (202, {'building': 2}))
+        status, payload = await self.get('/status')
+        self.assertEqual((payload['version'], payload['last_error']), (2, None))
+
+        status, payload = await self.get('/students/S001')
+        self.assertEqual(payload['courses'], {'ISYS089': 41.8, 'ISYS273': 72.4, 'COSC123': 57.1, 'COSC045': 10.0})
+        status, payload = await self.get('/students/S120')
+        self.assertNotIn('MATH346', payload['courses'])
+        status, payload = await self.get('/courses/COSC045')
+        self.assertEqual(payload['finished'], 4)
+        status, payload = await self.get('/pass-rate')
+        self.assertEqual((payload['total_scores'], payload['passed_scores']), self.results.count_pass_rate_scores())
+
+        # a batch where nothing is valid changes nothing but is still published as the next version
+        status, payload = await self.post('/corrections', {'upserts': [['S001'], [1, 2, 3]]})
+        status, payload = await self.get('/pass-rate')
+        self.assertEqual((payload['version'], payload['total_scores'], payload['passed_scores']), (3,) + self.results.count_pass_rate_scores())
+
+    async def test_correction_files_are_not_kept_as_loads(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'corrections.txt')
+            with open(file_name, 'w') as file:
+                file.write('S001, COSC045, 10\nS001, BIOL001, 50\nS012, COSC123, \n')
+            loads = len(self.results.load_stats)
+            for version in (2, 3):
+                status, payload = await self.post('/corrections', {'file': file_name})
+                self.assertEqual((status, payload), (202, {'building': version}))
+        self.assertEqual(len(self.results.load_stats), loads)
+        status, payload = await self.get('/students/S001')
+        self.assertEqual(payload['courses']['COSC045'], 10.0)
+        status, payload = await self.get('/students/S012')
+        self.assertEqual(payload['courses']['COSC123'], '--')
+        status, payload = await self.get('/status')
+        self.assertEqual((payload['version'], payload['last_error']), (3, None))
+
+    async def test_corrections_swap_is_atomic(self):
+        release = threading.Event()
+        build_corrections = self.query_server.build_corrections
+
+        def held_build(*args):
+            # the batch is applied and its snapshot built only once the test lets it
+            release.wait(5)
+            return build_corrections(*args)
+
+        self.query_server.build_corrections = held_build
+        old_totals = self.results.count_pass_rate_scores()
+        status, payload = await request(self.port, 'POST', '/corrections', {'upserts': [['S001', 'COSC045', 10], ['S012', 'COSC123', 95]]})
+        self.assertEqual(status, 202)
+        build = self.query_server.build
+
+        # while the batch is held every read is answered from version 1 and a second batch is turned away
+        status, payload = await self.get('/status')
+        self.assertEqual((payload['version'], payload['building']), (1, True))
+        self.assertEqual((await request(self.port, 'POST', '/corrections', {'upserts': []}))[0], 409)
+        status, payload = await self.get('/students/S001')
+        self.assertNotIn('COSC045', payload['courses'])
+
+        # reads keep going while the batch is applied and swapped in, every answer is either all old or all new
+        seen = []
+
+        async def keep_reading():
+            while not build.done():
+                status, payload = await self.get('/pass-rate')
+                seen.append((payload['version'], payload['total_scores'], payload['passed_scores']))
+
+        reading = asyncio.ensure_future(keep_reading())
+        await asyncio.sleep(0.05)
+        release.set()
+        await build
+        await reading
+        new_totals = self.results.count_pass_rate_scores()
+        self.assertNotEqual(old_totals, new_totals)
+        self.assertTrue(seen)
+        self.assertLessEqual(set(seen), {(1,) + old_totals, (2,) + new_totals})
+
+        status, payload = await self.get('/pass-rate')
+        self.assertEqual((payload['version'], payload['total_scores'], payload['passed_scores']), (2,) + new_totals)
+        status, payload = await self.get('/students/S001')
+        self.assertEqual(payload['courses']['COSC045'], 10.0)
+        status, payload = await self.get('/students/S012')
+        self.assertEqual(payload['courses']['COSC123'], 95.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import contextlib
+import io
+import os
+import random
+import unittest
+from unittest import mock
+
+from ScholaFlex import my_school
+from ScholaFlex.my_school import Results, SortedBuckets
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ScholaFlex')
+STUDENT_KINDS = (['UG'], ['PG', 'FT'], ['PG', 'PT'])
+
+
+def random_results(rng, students=60):
+    # the sample courses with random students, the scores are coarse so many students tie on their WGPA
+    results = Results()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results.read_courses(os.path.join(DATA, 'courses.txt'))
+    for number in range(students):
+        results.add_student_row([f'S{number:03}', 'Name', *rng.choice(STUDENT_KINDS)])
+    for student_id in results.students:
+        for course_id in rng.sample(list(results.courses), 3):
+            results.upsert_score(student_id, course_id, rng.choice([50.0, 60.0, 70.0, '--']))
+    return results
+
+
+class SortedBucketsTest(unittest.TestCase):
+    def test_matches_a_sorted_list(self):
+        rng = random.Random(6)
+        with mock.patch.object(my_school, 'RANKING_BUCKET_SIZE', 2):
+            entries = SortedBuckets()
+            expected = []
+            for step in range(2000):
+                if expected and rng.random() < 0.45:
+                    entry = rng.choice(expected)
+                    entries.remove(entry)
+                    expected.remove(entry)
+                else:
+                    entry = (rng.randint(0, 30), step, f'S{step}')  # many ties on the value, the order keeps them unique
+                    entries.add(entry)
+                    expected.append(entry)
+                    expected.sort()
+                if step % 50 == 0:
+                    self.assertEqual(list(entries), expected)
+                    self.assertEqual(len(entries), len(expected))
+                    # every bucket was split before it got past 2 * RANKING_BUCKET_SIZE, none is left empty
+                    self.assertTrue(all(0 < len(bucket) <= 4 for bucket in entries.buckets))
+                    self.assertEqual(entries.maxes, [bucket[-1] for bucket in entries.buckets])
+                    for value in range(-1, 32):
+                        key = (value, float('inf'))
+                        self.assertEqual(entries.count_above(key), sum(entry > key for entry in expected), value)
+            self.assertGreater(len(entries.buckets), 10)
+
+
+class RankingIndexTest(unittest.TestCase):
+    def check_rankings(self, results):
+        # every leaderboard and percentile against a sort of every student and course, ties go to the one indexed first
+        wgpa = {student_id: student.weighted_gpa_4(results.courses) for student_id, student in results.students.items()}
+        for student_type, mode in ((None, None), ('UG', None), ('PG', None), ('PG', 'PT'), (None, 'FT')):
+            matching = [student_id for student_id, student in results.students.items()
+                        if student_type in (None, student.student_type) and mode in (None, student.mode or 'FT')]
+            best = sorted(matching, key=lambda student_id: -wgpa[student_id])
+            self.assertEqual(results.top_students(len(matching) + 1, student_type, mode), [(student_id, wgpa[student_id]) for student_id in best])
+            for student_id in matching:
+                lower = sum(wgpa[other] < wgpa[student_id] for other in matching)
+                self.assertAlmostEqual(results.percentile_rank(student_id, student_type, mode), 100 * lower / len(matching))
+        for course_type, kind in ((None, my_school.Course), ('core', my_school.CoreCourse), ('elective', my_school.ElectiveCourse)):
+            hardest = sorted((course for course in results.courses.values() if isinstance(course, kind)), key=lambda course: course.average_score())
+            self.assertEqual(results.bottom_courses(10, course_type), [(course.id, course.average_score()) for course in hardest])
+
+    def test_leaderboards_follow_every_change(self):
+        rng = random.Random(7)
+        with mock.patch.object(my_school, 'RANKING_BUCKET_SIZE', 2):
+            results = random_results(rng)
+            self.check_rankings(results)
+            for step in range(200):
+                student_id, course_id = rng.choice(list(results.students)), rng.choice(list(results.courses))
+                if course_id in results.students[student_id].courses and rng.random() < 0.3:
+                    results.retract_score(student_id, course_id)
+                else:
+                    results.upsert_score(student_id, course_id, rng.choice([50.0, 60.0, 70.0, '--']))
+                if step % 20 == 0:
+                    self.check_rankings(results)
+            self.check_rankings(results)
+
+    def test_ties_go_to_the_first_student(self):
+        results = random_results(random.Random(8), students=6)
+        for student_id in results.students:
+            for course_id in list(results.students[student_id].courses):
+                results.retract_score(student_id, course_id)
+            results.upsert_score(student_id, 'COSC045', 80.0)
+        self.assertEqual([student_id for student_id, wgpa in results.top_students(6)], list(results.students))
+        # a student that moves away and back keeps its place among the tied ones
+        results.upsert_score('S000', 'COSC045', 10.0)
+        self.assertEqual(results.top_students(6)[-1][0], 'S000')
+        results.upsert_score('S000', 'COSC045', 80.0)
+        self.assertEqual([student_id for student_id, wgpa in results.top_students(6)], list(results.students))
+        self.assertEqual(results.percentile_rank('S003'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
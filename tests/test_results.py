@@ -0,0 +1,166 @@
+import contextlib
+import io
+import os
+import random
+import tempfile
+import unittest
+
+from ScholaFlex.my_school import Results, np, parse_result_row
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ScholaFlex')
+MODES = [{}, {'compact': True}] + ([{'columnar': True}] if np is not None else [])  # every way a Results can keep its scores
+
+# scores read twice in the same file, '--' turned into a mark and back, and marks on both sides of the 49.5 pass mark
+DUPLICATES = ("S001, COSC045, 49.4\nS001, COSC045, 49.5\nS012, COSC045, \nS012, COSC045, 80\nS034, ISYS089, 70\n"
+              "S034, ISYS089, \nS120, MATH346, 10\nS120, MATH346, 10\nS120, COSC045, 95\nS236, COSC045, 49.5\n")
+
+
+def recount(results):
+    # the (total score, finished, ongoing) of every course worked out again from the students
+    totals = {course_id: [0, 0, 0] for course_id in results.courses}
+    for student in results.students.values():
+        for course_id, score in student.courses.items():
+            if score == '--':
+                totals[course_id][2] += 1
+            else:
+                totals[course_id][0] += score
+                totals[course_id][1] += 1
+    return totals
+
+
+class ResultsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, text):
+        file_name = os.path.join(self.directory.name, name)
+        with open(file_name, 'w') as file:
+            file.write(text)
+        return file_name
+
+    def load(self, *results_texts, workers=None, chunk_size=3, **modes):
+        # the sample courses and students with results_texts as the results files, one text is read with
+        # read_results and several with read_results_many. The tiny chunks put duplicates in different chunks
+        results = Results(**modes)
+        file_names = [self.write(f'results_{number}.txt', text) for number, text in enumerate(results_texts)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            results.read_courses(os.path.join(DATA, 'courses.txt'))
+            results.read_students(os.path.join(DATA, 'students.txt'))
+            if len(file_names) == 1:
+                results.read_results(file_names[0], 'skip', chunk_size=chunk_size)
+            elif file_names:
+                results.read_results_many(file_names, workers, 'skip', chunk_size)
+        return results
+
+    def assertConsistent(self, results):
+        # the totals kept up to date on every change are the same as the ones worked out from scratch
+        self.assertEqual((results.total_scores, results.passed_scores), results.count_pass_rate_scores())
+        for course_id, (total_score, finished, ongoing) in recount(results).items():
+            course = results.courses[course_id]
+            self.assertEqual((course.students_finished, course.students_ongoing), (finished, ongoing), course_id)
+            self.assertAlmostEqual(course.total_score, total_score, msg=course_id)
+            self.assertAlmostEqual(course.average_score(), total_score / finished if finished else 0, msg=course_id)
+
+    def scores(self, results):
+        return {student_id: dict(student.courses.items()) for student_id, student in results.students.items()}
+
+    def test_direct_path_keeps_the_last_score(self):
+        for modes in MODES:
+            with self.subTest(**modes):
+                results = self.load(DUPLICATES + "S001, BIOL001, 50\nS999, COSC045, 50\nS001, ISYS089, abc\n", **modes)
+                self.assertConsistent(results)
+                self.assertEqual(results.students['S001'].courses['COSC045'], 49.5)
+                self.assertEqual(results.students['S012'].courses['COSC045'], 80.0)
+                self.assertEqual(results.students['S034'].courses['ISYS089'], '--')
+                self.assertEqual(results.count_pass_rate_scores(), (5, 4))
+                self.assertEqual(results.load_stats[-1].rejected, 3)
+
+                # the same rows one at a time through upsert_score
+                expected = self.load(**modes)
+                for line in DUPLICATES.splitlines():
+                    student_id, course_id, score = (field.strip() for field in line.split(','))
+                    expected.upsert_score(student_id, course_id, float(score) if score else '--')
+                self.assertEqual(self.scores(expected), self.scores(results))
+                self.assertEqual((expected.total_scores, expected.passed_scores), (results.total_scores, results.passed_scores))
+
+    def test_load_after_the_ranking_index_is_built(self):
+        for modes in MODES:
+            with self.subTest(**modes):
+                results = self.load(**modes)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results.read_results(os.path.join(DATA, 'results.txt'))
+                    results.compute_all_metrics()
+                    results.read_results(self.write('more.txt', DUPLICATES))
+                self.assertConsistent(results)
+                best = max(results.students.values(), key=lambda student: student.weighted_gpa_4(results.courses))
+                self.assertEqual(results.top_students(1)[0][0], best.id)
+
+    def test_upserts_and_retractions(self):
+        rng = random.Random(4)
+        for modes in MODES:
+            with self.subTest(**modes):
+                results = self.load(DUPLICATES, **modes)
+                results.compute_all_metrics()
+                for step in range(300):
+                    student_id, course_id = rng.choice(list(results.students)), rng.choice(list(results.courses))
+                    if course_id in results.students[student_id].courses and rng.random() < 0.4:
+                        score = results.students[student_id].courses[course_id]
+                        self.assertEqual(results.retract_score(student_id, course_id), score)
+                    else:
+                        results.upsert_score(student_id, course_id, rng.choice(['--', 49.4, 49.5, round(rng.uniform(0, 100), 1)]))
+                    if step % 25 == 0:
+                        self.assertConsistent(results)
+                self.assertConsistent(results)
+
+                # a bad retraction or upsert changes nothing
+                retracted = next((student_id, next(iter(student.courses))) for student_id, student in results.students.items() if student.courses)
+                results.retract_score(*retracted)
+                totals = results.count_pass_rate_scores()
+                for student_id, course_id in (('S999', 'COSC045'), ('S001', 'BIOL001')):
+                    with self.assertRaises(ValueError):
+                        results.upsert_score(student_id, course_id, 50.0)
+                for student_id, course_id in (('S999', 'COSC045'), ('S001', 'BIOL001'), retracted):
+                    with self.assertRaises(ValueError):
+                        results.retract_score(student_id, course_id)
+                self.assertEqual((results.total_scores, results.passed_scores), totals)
+
+    def test_shards_merge_like_reading_the_files_in_turn(self):
+        shards = [DUPLICATES, "S001, COSC045, 20\nS012, COSC045, \nS034, ISYS089, 75\nS034, ISYS089, 76\nS236, ISYS273, 49.5\n",
+                  "S001, COSC045, 90\nS120, COSC045, \nbad row\n"]
+        for modes in MODES:
+            for workers in (1, 2):
+                with self.subTest(workers=workers, **modes):
+                    results = self.load(*shards, workers=workers, **modes)
+                    self.assertConsistent(results)
+                    self.assertEqual(sum(stats.rejected for stats in results.load_stats), 1)
+
+                    expected = self.load(**modes)
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        for number in range(len(shards)):
+                            expected.read_results(os.path.join(self.directory.name, f'results_{number}.txt'), 'skip')
+                    self.assertEqual(self.scores(expected), self.scores(results))
+                    self.assertEqual(results.count_pass_rate_scores(), (results.total_scores, results.passed_scores))
+                    self.assertEqual(expected.count_pass_rate_scores(), results.count_pass_rate_scores())
+                    self.assertEqual(results.students['S001'].courses['COSC045'], 90.0)
+                    self.assertEqual(results.students['S120'].courses['COSC045'], '--')
+
+    def test_non_finite_scores_are_rejected(self):
+        for score in ('nan', 'NaN', 'inf', '-Infinity', '1e999'):
+            with self.assertRaisesRegex(ValueError, 'Invalid score value for student S001 in course COSC045'):
+                parse_result_row(['S001', ' COSC045', f' {score}'])
+        bad = "S001, COSC045, nan\nS001, ISYS089, inf\nS012, COSC123, -Infinity\nS012, ISYS273, 1e999\nS034, COSC045, 60\n"
+        for modes in MODES:
+            for texts in ([bad], [bad, "S120, MATH346, NAN\n"]):
+                with self.subTest(files=len(texts), **modes):
+                    results = self.load(*texts, workers=1, **modes)
+                    self.assertConsistent(results)
+                    self.assertEqual(sum(stats.rejected for stats in results.load_stats), 3 + len(texts))
+                    self.assertNotIn('COSC045', results.students['S001'].courses)
+                    self.assertNotIn('MATH346', results.students['S120'].courses)
+                    self.assertEqual(results.students['S034'].courses['COSC045'], 60.0)
+                    self.assertTrue(all(course.total_score == course.total_score for course in results.courses.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from ScholaFlex.my_school import ReportWriter, Results, StoreScores, np
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ScholaFlex')
+
+
+def load_sample(results_text=None, **modes):
+    # the sample courses and students with the sample results, or with results_text as the results file
+    results = Results(**modes)
+    with contextlib.redirect_stdout(io.StringIO()), tempfile.TemporaryDirectory() as directory:
+        results.read_courses(os.path.join(DATA, 'courses.txt'))
+        results.read_students(os.path.join(DATA, 'students.txt'))
+        results_file = os.path.join(DATA, 'results.txt')
+        if results_text is not None:
+            results_file = os.path.join(directory, 'results.txt')
+            with open(results_file, 'w') as file:
+                file.write(results_text)
+        results.read_results(results_file, 'skip')
+    return results
+
+
+def report(results):
+    writer = ReportWriter([io.StringIO()], 'json')
+    results.compute_all_metrics()
+    results.display_results(writer)
+    results.display_actual_results(writer, sparse=True)
+    writer.flush()
+    return writer.sinks[0].getvalue()
+
+
+@unittest.skipIf(np is None, 'the columnar store needs numpy')
+class ScoreStoreTest(unittest.TestCase):
+    def assertSameResults(self, expected, actual):
+        # the same scores in the same order, the same metrics, course counters and pass rate totals
+        for student_id, student in expected.students.items():
+            self.assertEqual(list(student.courses.items()), list(actual.students[student_id].courses.items()), student_id)
+            expected_metrics, actual_metrics = student.student_metrics(expected.courses), actual.students[student_id].student_metrics(actual.courses)
+            for name, value in expected_metrics.items():
+                self.assertAlmostEqual(value, actual_metrics[name], msg=f"{student_id} {name}")
+        for course_id, course in expected.courses.items():
+            other = actual.courses[course_id]
+            self.assertEqual((course.students_finished, course.students_ongoing), (other.students_finished, other.students_ongoing), course_id)
+            self.assertAlmostEqual(course.average_score(), other.average_score())
+        self.assertEqual(actual.count_pass_rate_scores(), (actual.total_scores, actual.passed_scores))
+        self.assertEqual(expected.count_pass_rate_scores(), actual.count_pass_rate_scores())
+
+    def test_students_read_their_row(self):
+        results = load_sample(columnar=True)
+        courses = results.students['S034'].courses
+        self.assertIs(type(courses), StoreScores)
+        self.assertEqual(dict(courses), {'COSC123': 85.7, 'COSC045': '--', 'ISYS089': 89.0, 'ISYS273': 74.5})
+        self.assertEqual(len(courses), 4)
+        self.assertNotIn('MATH346', courses)
+        self.assertEqual(report(load_sample()), report(results))
+        self.assertSameResults(load_sample(), results)
+
+    def test_a_score_read_again_replaces_the_first(self):
+        text = ("S001, COSC045, 40\nS001, ISYS089, \nS001, COSC045, 60\nS012, COSC123, 50\n"
+                "S012, COSC123, \nS001, ISYS089, 70\nbad row\nS999, COSC045, 1\n")
+        results = load_sample(text, columnar=True)
+        self.assertEqual(list(results.students['S001'].courses.items()), [('COSC045', 60.0), ('ISYS089', 70.0)])
+        self.assertEqual(results.students['S012'].courses['COSC123'], '--')
+        self.assertEqual(results.load_stats[-1].rejected, 2)
+        self.assertSameResults(load_sample(text), results)
+
+    def test_corrections(self):
+        expected, results = load_sample(), load_sample(columnar=True)
+        for target in (expected, results):
+            target.compute_all_metrics()
+            target.upsert_score('S034', 'COSC045', 91.0)  # in place
+            target.upsert_score('S001', 'COSC045', '--')  # a new course moves the row to the overflow
+            target.retract_score('S012', 'COSC123')
+            target.upsert_score('S012', 'MATH346', 20.0)
+        self.assertSameResults(expected, results)
+        self.assertEqual(expected.top_students(6), results.top_students(6))
+        self.assertEqual(expected.bottom_courses(5), results.bottom_courses(5))
+        self.assertEqual(sorted(results.score_store.overflow), sorted(results.students[student_id].courses.row for student_id in ('S001', 'S012')))
+
+        # the next load merges the overflow back into the arrays
+        results.finish_score_store()
+        self.assertEqual(results.score_store.overflow, {})
+        self.assertSameResults(expected, results)
+        with self.assertRaises(ValueError):
+            results.retract_score('S012', 'COSC123')
+
+    def test_snapshot(self):
+        results = load_sample(columnar=True)
+        results.upsert_score('S001', 'COSC045', 55.5)
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'results.snapshot')
+            results.save_snapshot(file_name)
+            loaded = Results.load_snapshot(file_name, columnar=True)
+        self.assertIsNotNone(loaded.score_store)
+        self.assertSameResults(results, loaded)
+        self.assertEqual(report(results), report(loaded))
+
+    def test_modes_cannot_be_mixed(self):
+        with self.assertRaises(ValueError):
+            Results(compact=True, columnar=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from ScholaFlex.my_school import SNAPSHOT_HEADER, CompactScores, ReportWriter, Results, np
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ScholaFlex')
+MODES = [{}, {'compact': True}] + ([{'columnar': True}] if np is not None else [])
+
+
+def load_sample():
+    results = Results()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results.read_courses(os.path.join(DATA, 'courses.txt'))
+        results.read_students(os.path.join(DATA, 'students.txt'))
+        results.read_results(os.path.join(DATA, 'results.txt'))
+    return results
+
+
+def report(results):
+    writer = ReportWriter([io.StringIO()], 'json')
+    results.compute_all_metrics()
+    results.display_course_info(writer)
+    results.display_results(writer)
+    results.display_actual_results(writer, sparse=True)
+    writer.flush()
+    return writer.sinks[0].getvalue()
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.file_name = os.path.join(self.directory.name, 'results.snapshot')
+
+    def test_round_trip(self):
+        results = load_sample()
+        results.upsert_score('S001', 'COSC045', '--')
+        results.upsert_score('S012', 'MATH346', 49.5)
+        results.save_snapshot(self.file_name)
+        self.assertEqual(os.listdir(self.directory.name), ['results.snapshot'])  # the temporary file was renamed
+        for modes in MODES:
+            with self.subTest(**modes):
+                loaded = Results.load_snapshot(self.file_name, **modes)
+                self.assertEqual(list(loaded.courses), list(results.courses))
+                self.assertEqual(list(loaded.students), list(results.students))
+                for student_id, student in results.students.items():
+                    other = loaded.students[student_id]
+                    self.assertEqual((type(other), other.name, other.mode), (type(student), student.name, student.mode))
+                    self.assertEqual(list(other.courses.items()), list(student.courses.items()), student_id)
+                for course_id, course in results.courses.items():
+                    other = loaded.courses[course_id]
+                    self.assertEqual((type(other), other.name, other.credit, other.semester), (type(course), course.name, course.credit, course.semester))
+                    self.assertEqual((other.total_score, other.students_finished, other.students_ongoing),
+                                     (course.total_score, course.students_finished, course.students_ongoing))
+                self.assertEqual((loaded.total_scores, loaded.passed_scores), (results.total_scores, results.passed_scores))
+                self.assertEqual(report(loaded), report(results))
+
+    def test_compact_load(self):
+        results = load_sample()
+        results.save_snapshot(self.file_name)
+        loaded = Results.load_snapshot(self.file_name, compact=True)
+        self.assertTrue(all(type(student.courses) is CompactScores for student in loaded.students.values()))
+        self.assertEqual(loaded.students['S034'].courses['COSC045'], '--')
+        # a compact Results loaded from a snapshot takes corrections like one read from the text files
+        loaded.upsert_score('S034', 'COSC045', 60.0)
+        self.assertEqual(loaded.students['S034'].courses['COSC045'], 60.0)
+        self.assertEqual(loaded.count_pass_rate_scores(), (loaded.total_scores, loaded.passed_scores))
+
+    def test_empty_and_foreign_files(self):
+        for content in (b'', b'SCHF', b'x' * 200):
+            with self.subTest(content=content[:8]):
+                with open(self.file_name, 'wb') as file:
+                    file.write(content)
+                with self.assertRaisesRegex(ValueError, 'not a ScholaFlex snapshot'):
+                    Results.load_snapshot(self.file_name)
+
+    def test_truncated_file(self):
+        load_sample().save_snapshot(self.file_name)
+        with open(self.file_name, 'rb') as file:
+            data = file.read()
+        # cut inside the first section, in the middle of the file and one byte short of the end
+        for size in (SNAPSHOT_HEADER.size + 8, len(data) // 2, len(data) - 1):
+            with self.subTest(size=size):
+                with open(self.file_name, 'wb') as file:
+                    file.write(data[:size])
+                with self.assertRaisesRegex(ValueError, 'truncated'):
+                    Results.load_snapshot(self.file_name)
+
+
+if __name__ == '__main__':
+    unittest.main()